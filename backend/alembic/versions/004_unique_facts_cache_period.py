@@ -0,0 +1,31 @@
+"""Make facts_cache.period_hours unique
+
+Revision ID: 004_unique_facts_cache_period
+Revises: 003_alter_facts_cache_period
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '004_unique_facts_cache_period'
+down_revision = '003_alter_facts_cache_period'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Keep only the newest entry per period before enforcing uniqueness
+    op.execute("""
+        DELETE FROM facts_cache a
+        USING facts_cache b
+        WHERE a.period_hours = b.period_hours
+          AND (a.generated_at, a.id::text) < (b.generated_at, b.id::text)
+    """)
+    op.drop_index('ix_facts_cache_period_hours', table_name='facts_cache')
+    op.create_index('ix_facts_cache_period', 'facts_cache', ['period_hours'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_facts_cache_period', table_name='facts_cache')
+    op.create_index('ix_facts_cache_period_hours', 'facts_cache', ['period_hours'])
@@ -0,0 +1,23 @@
+"""Add embedding_centroid to facts_cache
+
+Revision ID: 005_add_facts_cache_centroid
+Revises: 004_unique_facts_cache_period
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005_add_facts_cache_centroid'
+down_revision = '004_unique_facts_cache_period'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('facts_cache', sa.Column('embedding_centroid', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('facts_cache', 'embedding_centroid')
@@ -0,0 +1,36 @@
+"""Add analysis_jobs table for Gemini Batch API analysis
+
+Revision ID: 006_add_analysis_jobs
+Revises: 005_add_facts_cache_centroid
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '006_add_analysis_jobs'
+down_revision = '005_add_facts_cache_centroid'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'analysis_jobs',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('batch_name', sa.String(255), nullable=False),
+        sa.Column('article_ids', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(20), nullable=False, server_default='pending'),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('batch_name')
+    )
+    op.create_index('ix_analysis_jobs_status', 'analysis_jobs', ['status'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_analysis_jobs_status', table_name='analysis_jobs')
+    op.drop_table('analysis_jobs')
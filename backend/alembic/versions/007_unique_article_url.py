@@ -0,0 +1,37 @@
+"""Make articles.url unique
+
+Revision ID: 007_unique_article_url
+Revises: 006_add_analysis_jobs
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '007_unique_article_url'
+down_revision = '006_add_analysis_jobs'
+branch_labels = None
+depends_on = None
+
+_DUPLICATES = """
+    SELECT a.id FROM articles a
+    JOIN articles b ON a.url = b.url
+     AND (a.fetched_at, a.id::text) > (b.fetched_at, b.id::text)
+"""
+
+
+def upgrade() -> None:
+    # Keep only the first fetched article per URL before enforcing uniqueness
+    op.execute(f"DELETE FROM entities WHERE article_id IN ({_DUPLICATES})")
+    op.execute(f"DELETE FROM article_analysis WHERE article_id IN ({_DUPLICATES})")
+    op.execute(f"DELETE FROM articles WHERE id IN ({_DUPLICATES})")
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_articles_url', 'articles', ['url'],
+            unique=True, postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_articles_url', table_name='articles', postgresql_concurrently=True)
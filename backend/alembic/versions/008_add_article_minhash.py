@@ -0,0 +1,23 @@
+"""Add minhash signature to articles
+
+Revision ID: 008_add_article_minhash
+Revises: 007_unique_article_url
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008_add_article_minhash'
+down_revision = '007_unique_article_url'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('articles', sa.Column('minhash', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('articles', 'minhash')
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
@@ -211,7 +211,7 @@ async def get_stats(db: Session = Depends(get_db)):
 @router.post("/fetch-now")
 async def trigger_fetch():
     """Trigger manual para obtener noticias inmediatamente."""
-    if news_scheduler._fetch_in_progress:
+    if news_scheduler.fetch_in_progress:
         return {"status": "skipped", "message": "Fetch ya en progreso, intente más tarde"}
     try:
         await news_scheduler.run_now()
@@ -223,12 +223,10 @@ async def trigger_fetch():
 @router.post("/analyze-pending")
 async def analyze_pending_articles(db: Session = Depends(get_db)):
     """Analiza artículos que no tienen análisis."""
-    from app.services.gemini_analyzer import GeminiAnalyzer
+    from app.services.gemini_analyzer import gemini_analyzer as analyzer
     from app.models import ArticleAnalysis, Entity
     from datetime import datetime
 
-    analyzer = GeminiAnalyzer()
-
     # Obtener artículos sin análisis
     pending = db.query(Article).filter(
         ~Article.id.in_(
@@ -277,8 +275,22 @@ async def health_check():
     return {"status": "ok", "timestamp": datetime.utcnow().isoformat()}
 
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    """True if the client's If-None-Match already has this ETag (respond 304)."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+def _og_image_format(request: Request) -> str:
+    """Serve WebP to clients that accept it, PNG otherwise."""
+    return "webp" if "image/webp" in request.headers.get("accept", "") else "png"
+
+
 @router.get("/og")
 async def generate_og_image(
+    request: Request,
     title: str = Query(..., min_length=1, max_length=200, description="Main title text"),
     subtitle: Optional[str] = Query(None, max_length=300, description="Optional subtitle/description"),
     category: Optional[str] = Query(None, description="Category: breaking, politics, tech, default"),
@@ -293,22 +305,30 @@ async def generate_og_image(
     from fastapi.responses import Response
     from app.services.og_image_generator import og_generator
 
+    image_format = _og_image_format(request)
+    # The URL (plus Accept) fully determines the image, so it can be cached forever
+    headers = {
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{og_generator.og_cache_key(title, subtitle, category, badge)}-{image_format}"',
+        "Vary": "Accept",
+    }
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
     try:
         image_bytes = await og_generator.generate_og_image(
             title=title,
             subtitle=subtitle,
             category=category,
             badge=badge,
-            use_imagen_base=False  # Always use gradient for this endpoint
+            use_imagen_base=False,  # Always use gradient for this endpoint
+            image_format=image_format
         )
 
         return Response(
             content=image_bytes,
-            media_type="image/png",
-            headers={
-                "Cache-Control": "public, max-age=86400",  # Cache for 24 hours
-                "Content-Disposition": "inline"
-            }
+            media_type=f"image/{image_format}",
+            headers={**headers, "Content-Disposition": "inline"}
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate OG image: {str(e)}")
@@ -316,6 +336,7 @@ async def generate_og_image(
 
 @router.get("/og/ai")
 async def generate_ai_og_image(
+    request: Request,
     page: str = Query("default", description="Page: home, facts, sources, entities, article, default"),
     refresh: bool = Query(False, description="Force regenerate the image (clears cache)"),
 ):
@@ -336,26 +357,19 @@ async def generate_ai_og_image(
 
     # Clear cache for this page if refresh requested
     if refresh:
-        import hashlib
-        from pathlib import Path
-        # Clear the final cached image
-        cache_key = hashlib.md5(f"ai_og_{page}".encode()).hexdigest()[:16]
-        cache_path = Path("/tmp/og_cache") / f"ai_og_{cache_key}.png"
-        if cache_path.exists():
-            cache_path.unlink()
-        # Clear base AI images for this page
-        for f in Path("/tmp/og_base").glob("ai_full_*.png"):
-            f.unlink()
+        og_generator.invalidate_ai_page(page)
 
     try:
-        image_bytes = await og_generator.generate_ai_og_image(page=page)
+        image_format = _og_image_format(request)
+        image_bytes = await og_generator.generate_ai_og_image(page=page, image_format=image_format)
 
         return Response(
             content=image_bytes,
-            media_type="image/png",
+            media_type=f"image/{image_format}",
             headers={
                 "Cache-Control": "public, max-age=604800",  # Cache for 7 days (AI images are expensive)
-                "Content-Disposition": "inline"
+                "Content-Disposition": "inline",
+                "Vary": "Accept"
             }
         )
     except Exception as e:
@@ -372,6 +386,7 @@ async def clear_og_cache():
 
 @router.get("/og/article/{article_id}")
 async def generate_article_og_image(
+    request: Request,
     article_id: UUID,
     use_ai_base: bool = Query(False, description="Use Gemini AI for background"),
     db: Session = Depends(get_db)
@@ -395,22 +410,31 @@ async def generate_article_og_image(
         # Add VERIFICADO badge if article has been analyzed
         badge = "VERIFICADO"
 
+    title = article.title[:150] if article.title else "LatBot News"
+    image_format = _og_image_format(request)
+    # The image changes once the article is analyzed, so revalidate via ETag
+    headers = {
+        "Cache-Control": "public, max-age=86400",
+        "ETag": f'"{og_generator.og_cache_key(title, subtitle, None, badge)}-{image_format}"',
+        "Vary": "Accept",
+    }
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
     try:
         image_bytes = await og_generator.generate_og_image(
-            title=article.title[:150] if article.title else "LatBot News",
+            title=title,
             subtitle=subtitle,
             category=None,
             badge=badge,
-            use_imagen_base=use_ai_base
+            use_imagen_base=use_ai_base,
+            image_format=image_format
         )
 
         return Response(
             content=image_bytes,
-            media_type="image/png",
-            headers={
-                "Cache-Control": "public, max-age=86400",
-                "Content-Disposition": "inline"
-            }
+            media_type=f"image/{image_format}",
+            headers={**headers, "Content-Disposition": "inline"}
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate OG image: {str(e)}")
@@ -565,7 +589,9 @@ async def refresh_facts_cache(
     except ValueError:
         return {"error": "Invalid date format. Use YYYY-MM-DD"}
 
-    result = await fact_extractor.update_facts_cache(db, date_from=parsed_from, date_to=parsed_to)
+    result = await fact_extractor.update_facts_cache(
+        db, date_from=parsed_from, date_to=parsed_to, bypass_semantic_cache=True
+    )
 
     return {
         "status": "success",
@@ -620,8 +646,8 @@ async def get_facts_cache_status(db: Session = Depends(get_db)):
             "message": "No articles found in database"
         }
 
-    # Get all periods
-    periods = fact_extractor.get_weekly_periods(min_date, max_date)
+    # Get the periods the backfill processes (weeks with articles)
+    periods = fact_extractor.get_nonempty_weekly_periods(db, min_date, max_date)
     processed_periods = fact_extractor.get_processed_periods(db)
 
     # Count stats
@@ -9,9 +9,16 @@ class Settings(BaseSettings):
 
     # News API
     newsdata_api_key: str = ""
+    newsdata_rate_per_minute: int = 25  # Token bucket for NewsData.io requests
 
     # Gemini AI
     gemini_api_key: str = ""
+    gemini_concurrency: int = 8  # Max concurrent Gemini requests per batch
+    gemini_rate_per_minute: int = 60  # Token bucket for Gemini analysis requests
+    gemini_max_input_chars: int = 4000  # Article content sent to Gemini is cut to this length
+    gemini_batch_analysis: bool = True  # Scheduled runs analyze via the Gemini Batch API
+    gemini_batch_poll_minutes: int = 5
+    near_duplicate_threshold: float = 0.85  # MinHash similarity at which an article reuses an existing analysis
 
     # Apify (primary)
     apify_api_key: str = ""
@@ -22,6 +29,8 @@ class Settings(BaseSettings):
     # App Config
     fetch_interval_minutes: int = 10
     debug: bool = True
+    og_cache_max_mb: int = 500  # Size bound of the rendered OG image cache on disk
+    og_prewarm: bool = True  # Pre-generate the page OG images in the background at startup
 
     # CORS (comma-separated string or list)
     cors_origins: str = "http://localhost:5173,http://localhost:3000"
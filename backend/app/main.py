@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
@@ -7,6 +8,7 @@ from app.config import get_settings
 from app.database import engine, Base
 from app.api import router
 from app.services.scheduler import news_scheduler
+from app.services.og_image_generator import og_generator
 
 # Configurar logging
 logging.basicConfig(
@@ -32,11 +34,17 @@ async def lifespan(app: FastAPI):
     news_scheduler.start()
     logger.info("Scheduler iniciado")
 
+    # Pre-generar las imágenes OG de las páginas en segundo plano
+    prewarm_task = asyncio.create_task(og_generator.prewarm()) if settings.og_prewarm else None
+
     yield
 
     # Shutdown
     logger.info("Deteniendo aplicación...")
+    if prewarm_task and not prewarm_task.done():
+        prewarm_task.cancel()
     news_scheduler.stop()
+    await news_scheduler.news_fetcher.aclose()
 
 
 app = FastAPI(
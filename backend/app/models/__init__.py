@@ -1,3 +1,3 @@
-from app.models.article import Article, ArticleAnalysis, Entity, FactsCache
+from app.models.article import Article, ArticleAnalysis, Entity, FactsCache, AnalysisJob
 
-__all__ = ["Article", "ArticleAnalysis", "Entity", "FactsCache"]
+__all__ = ["Article", "ArticleAnalysis", "Entity", "FactsCache", "AnalysisJob"]
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Text, Float, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, String, Text, Float, ForeignKey, DateTime, Enum, Index, LargeBinary
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -39,13 +39,14 @@ class Article(Base):
     title = Column(Text, nullable=False)
     description = Column(Text, nullable=True)
     content = Column(Text, nullable=True)
-    url = Column(String(2048), nullable=False)
+    url = Column(String(2048), nullable=False, unique=True, index=True)
     image_url = Column(String(2048), nullable=True)
     source_name = Column(String(255), nullable=True)
     published_at = Column(DateTime, nullable=True)
     fetched_at = Column(DateTime, default=datetime.utcnow)
     language = Column(String(10), default="es")
     country = Column(String(100), nullable=True)
+    minhash = Column(LargeBinary, nullable=True)  # MinHash (64 x uint32) of title + first 500 chars, for near-duplicates
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -85,10 +86,26 @@ class Entity(Base):
 class FactsCache(Base):
     """Cache for AI-generated facts analysis. Updated every 2 hours."""
     __tablename__ = "facts_cache"
+    __table_args__ = (
+        Index("ix_facts_cache_period", "period_hours", unique=True),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     period_hours = Column(String(50), nullable=False, default="24")  # e.g., "24", "48" or "YYYY-MM-DD_YYYY-MM-DD"
     facts_json = Column(Text, nullable=False)  # JSON string with facts, timeline, key_figures
     article_count = Column(Float, default=0)
+    embedding_centroid = Column(LargeBinary, nullable=True)  # float16 mean embedding of the period's articles
     generated_at = Column(DateTime, default=datetime.utcnow)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class AnalysisJob(Base):
+    """Gemini Batch API job analyzing a group of articles. Polled by the scheduler."""
+    __tablename__ = "analysis_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    batch_name = Column(String(255), nullable=False, unique=True)  # e.g. "batches/abc123"
+    article_ids = Column(Text, nullable=False)  # JSON list, same order as the batch requests
+    status = Column(String(20), nullable=False, default="pending", index=True)  # pending | succeeded | failed
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
@@ -8,6 +8,15 @@ from app.schemas.article import (
     GeminiAnalysisResult,
     StatsResponse,
 )
+from app.schemas.gemini import (
+    AnalysisEntitySchema,
+    AnalysisResponseSchema,
+    BulkAnalysisItemSchema,
+    FactSchema,
+    TimelineEventSchema,
+    KeyFigureSchema,
+    FactsResponseSchema,
+)
 
 __all__ = [
     "ArticleBase",
@@ -18,4 +27,11 @@ __all__ = [
     "EntityResponse",
     "GeminiAnalysisResult",
     "StatsResponse",
+    "AnalysisEntitySchema",
+    "AnalysisResponseSchema",
+    "BulkAnalysisItemSchema",
+    "FactSchema",
+    "TimelineEventSchema",
+    "KeyFigureSchema",
+    "FactsResponseSchema",
 ]
@@ -0,0 +1,58 @@
+from pydantic import BaseModel
+from typing import Optional
+
+
+# Response schemas passed to Gemini as `response_schema` (structured output).
+# Fields have no defaults on purpose: the SDK's schema conversion rejects them.
+
+
+class AnalysisEntitySchema(BaseModel):
+    type: str
+    value: str
+    relevance: float
+
+
+class AnalysisResponseSchema(BaseModel):
+    political_bias: str
+    bias_confidence: float
+    tone: str
+    tone_confidence: float
+    summary: str
+    entities: list[AnalysisEntitySchema]
+
+
+class BulkAnalysisItemSchema(AnalysisResponseSchema):
+    idx: int
+
+
+class FactSchema(BaseModel):
+    id: str
+    fact: str
+    category: str
+    importance: str
+    who: list[str]
+    when: Optional[str]
+    where: Optional[str]
+    quote: Optional[str]
+    quote_author: Optional[str]
+    article_indices: list[int]
+    sentiment: str
+
+
+class TimelineEventSchema(BaseModel):
+    date: str
+    event: str
+    fact_ids: list[str]
+
+
+class KeyFigureSchema(BaseModel):
+    name: str
+    role: str
+    stance: str
+    mentions: int
+
+
+class FactsResponseSchema(BaseModel):
+    facts: list[FactSchema]
+    timeline_events: list[TimelineEventSchema]
+    key_figures: list[KeyFigureSchema]
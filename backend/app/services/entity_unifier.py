@@ -1,14 +1,18 @@
+import re
 import json
 import logging
 from typing import Optional
-import google.generativeai as genai
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from app.config import get_settings
 from app.models import Entity
+from app.services.gemini_client import get_generative_model
 
 logger = logging.getLogger(__name__)
 
+# Optional ```json ... ``` fence around a model response
+_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL)
+
 
 class EntityUnifier:
     """Servicio para unificar entidades duplicadas usando Gemini AI."""
@@ -46,11 +50,8 @@ Solo incluye grupos donde hay AL MENOS 2 variantes."""
 
     def __init__(self):
         self.settings = get_settings()
-        if self.settings.gemini_api_key:
-            genai.configure(api_key=self.settings.gemini_api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-        else:
-            self.model = None
+        self.model = get_generative_model()
+        if not self.model:
             logger.warning("Gemini API key not configured")
 
     async def get_entity_groups(self, db: Session, entity_type: Optional[str] = None, min_count: int = 2) -> list[dict]:
@@ -103,15 +104,11 @@ Solo incluye grupos donde hay AL MENOS 2 variantes."""
             prompt = self.UNIFY_PROMPT.format(entities=entity_list)
 
             try:
-                response = self.model.generate_content(prompt)
-                result_text = response.text.strip()
-
-                # Clean markdown if present
-                if result_text.startswith("```"):
-                    result_text = result_text.split("```")[1]
-                    if result_text.startswith("json"):
-                        result_text = result_text[4:]
-                    result_text = result_text.strip()
+                response = await self.model.generate_content_async(prompt)
+                # Clean markdown fences if present
+                result_text = response.text
+                match = _FENCE_RE.match(result_text)
+                result_text = match.group(1) if match else result_text.strip()
 
                 # Extract JSON
                 if not result_text.startswith("{"):
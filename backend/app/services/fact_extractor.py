@@ -1,13 +1,19 @@
 import json
+import orjson
+import asyncio
 import logging
+import heapq
 import hashlib
+import numpy as np
 from typing import Optional, List, Tuple
 from datetime import datetime, timedelta, date
 import google.generativeai as genai
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from sqlalchemy import desc, func, text
 from app.config import get_settings
 from app.models import Article, ArticleAnalysis, FactsCache
+from app.schemas import FactsResponseSchema
+from app.services.gemini_client import get_generative_model
 
 logger = logging.getLogger(__name__)
 
@@ -63,13 +69,43 @@ Responde SOLO con JSON válido (sin markdown):
 
 Máximo 10 hechos principales, ordenados por importancia."""
 
+    REDUCE_PROMPT = """Los siguientes hechos fueron extraídos de distintos lotes de artículos del mismo periodo.
+Muchos se repiten o describen el mismo suceso con otras palabras.
+
+RESULTADOS PARCIALES (JSON):
+{results}
+
+INSTRUCCIONES:
+1. Fusiona los hechos que describen el mismo suceso en uno solo
+2. Al fusionar, une sus "article_indices" (sin repetir) y conserva la cita más relevante
+3. Fusiona eventos de la línea de tiempo duplicados y actualiza sus "fact_ids"
+4. Fusiona figuras clave por nombre sumando sus "mentions"
+5. No inventes hechos nuevos ni cambies los índices de artículo
+
+Responde SOLO con JSON válido (sin markdown) con la misma estructura de entrada:
+{{"facts": [...], "timeline_events": [...], "key_figures": [...]}}
+
+Máximo 10 hechos principales, ordenados por importancia."""
+
+    # Articles per prompt; larger sets are split and merged with REDUCE_PROMPT
+    CHUNK_SIZE = 50
+    MAX_CONTENT_CHARS = 1000
+    MAX_CONCURRENT_CHUNKS = 4
+
+    # Semantic cache: keep a period's previous facts while its article set is near-identical.
+    # Only the same period is considered: facts cite dates, sources and article indices of
+    # their own period, so copying them into another week would give wrong citations.
+    EMBEDDING_MODEL = "models/text-embedding-004"
+    EMBEDDING_BATCH_SIZE = 100
+    SEMANTIC_CACHE_THRESHOLD = 0.95
+
+    # Historical backfill writes cache rows in batches of this many periods
+    CACHE_FLUSH_EVERY = 10
+
     def __init__(self):
         self.settings = get_settings()
-        if self.settings.gemini_api_key:
-            genai.configure(api_key=self.settings.gemini_api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-        else:
-            self.model = None
+        self.model = get_generative_model(response_schema=FactsResponseSchema)
+        if not self.model:
             logger.warning("Gemini API key not configured for FactExtractor")
 
     async def extract_facts(
@@ -84,6 +120,18 @@ Máximo 10 hechos principales, ordenados por importancia."""
         if not self.model:
             return {"error": "Gemini not configured", "facts": []}
 
+        articles = self.get_articles_for_range(db, date_from, date_to, limit=limit, topic=topic)
+        return await self.extract_facts_from_articles(articles, date_from, date_to)
+
+    def get_articles_for_range(
+        self,
+        db: Session,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        limit: Optional[int] = None,
+        topic: Optional[str] = None
+    ) -> List[Article]:
+        """Get articles published within a date range (last 24h if no range given)."""
         # Query ALL articles (no join required - we just need article content)
         # Use outerjoin to include articles that may not have analysis yet
         if not date_from and not date_to:
@@ -113,6 +161,15 @@ Máximo 10 hechos principales, ordenados por importancia."""
             # No limit - get all articles in the period
             articles = query.all()
 
+        return articles
+
+    async def extract_facts_from_articles(
+        self,
+        articles: List[Article],
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None
+    ) -> dict:
+        """Extract facts from an already loaded list of articles."""
         if not articles:
             return {
                 "facts": [],
@@ -124,29 +181,9 @@ Máximo 10 hechos principales, ordenados por importancia."""
             }
 
         # Format articles for the prompt
-        # Adjust content truncation based on article count to stay within token limits
         total_articles = len(articles)
-        articles_text = ""
         article_map = {}
 
-        # Calculate max content length based on article count
-        # Gemini 2.5 Flash has ~1M token context, but we want to stay reasonable
-        # Target ~100k chars total for article content
-        if total_articles <= 50:
-            max_content = 1000
-        elif total_articles <= 100:
-            max_content = 600
-        elif total_articles <= 200:
-            max_content = 400
-        elif total_articles <= 500:
-            max_content = 200
-        elif total_articles <= 1000:
-            max_content = 100  # Title + brief snippet
-        else:
-            max_content = 50  # Just a tiny snippet for massive batches
-
-        logger.info(f"Processing {total_articles} articles with max_content={max_content} chars each")
-
         for i, article in enumerate(articles):
             article_map[i] = {
                 "id": str(article.id),
@@ -157,34 +194,27 @@ Máximo 10 hechos principales, ordenados por importancia."""
                 "bias": article.analysis.political_bias if article.analysis else None,
                 "tone": article.analysis.tone if article.analysis else None,
             }
-            content = article.content or article.description or ""
-            content = content[:max_content] if len(content) > max_content else content
-            articles_text += f"\n[Artículo {i}] - {article.source_name}\nTítulo: {article.title}\nContenido: {content}\n"
-
-        prompt = self.EXTRACT_PROMPT.format(articles=articles_text)
 
         try:
-            response = self.model.generate_content(prompt)
-            result_text = response.text.strip()
-
-            # Clean markdown if present
-            if result_text.startswith("```"):
-                result_text = result_text.split("```")[1]
-                if result_text.startswith("json"):
-                    result_text = result_text[4:]
-                result_text = result_text.strip()
-
-            # Extract JSON
-            if not result_text.startswith("{"):
-                start = result_text.find("{")
-                if start != -1:
-                    result_text = result_text[start:]
-            if not result_text.endswith("}"):
-                end = result_text.rfind("}")
-                if end != -1:
-                    result_text = result_text[:end + 1]
-
-            result = json.loads(result_text)
+            if total_articles <= self.CHUNK_SIZE:
+                logger.info(f"Processing {total_articles} articles in a single prompt")
+                result = await self._extract_chunk(articles, offset=0)
+            else:
+                # Map-reduce: extract each chunk with full content, then merge
+                chunks = [
+                    (offset, articles[offset:offset + self.CHUNK_SIZE])
+                    for offset in range(0, total_articles, self.CHUNK_SIZE)
+                ]
+                logger.info(f"Processing {total_articles} articles in {len(chunks)} chunks of {self.CHUNK_SIZE}")
+
+                semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_CHUNKS)
+
+                async def run_chunk(offset: int, chunk: list) -> dict:
+                    async with semaphore:
+                        return await self._extract_chunk(chunk, offset=offset)
+
+                partials = await asyncio.gather(*(run_chunk(offset, chunk) for offset, chunk in chunks))
+                result = await self._reduce_chunks(partials)
 
             # Enrich facts with source information
             facts = result.get("facts", [])
@@ -231,6 +261,36 @@ Máximo 10 hechos principales, ordenados por importancia."""
                 "date_to": date_to.isoformat() if date_to else None,
             }
 
+    async def _generate_json(self, prompt: str) -> dict:
+        """Send a prompt to Gemini and parse the JSON object in the response."""
+        response = await self.model.generate_content_async(prompt)
+        # Structured output guarantees valid JSON matching FactsResponseSchema
+        return orjson.loads(response.text)
+
+    async def _extract_chunk(self, articles: List[Article], offset: int = 0) -> dict:
+        """Extract raw facts from a subset of articles. Indices are global (offset-based)."""
+        articles_text = ""
+        for i, article in enumerate(articles, start=offset):
+            content = article.content or article.description or ""
+            content = content[:self.MAX_CONTENT_CHARS]
+            articles_text += f"\n[Artículo {i}] - {article.source_name}\nTítulo: {article.title}\nContenido: {content}\n"
+
+        prompt = self.EXTRACT_PROMPT.format(articles=articles_text)
+        return await self._generate_json(prompt)
+
+    async def _reduce_chunks(self, partials: List[dict]) -> dict:
+        """Merge per-chunk extraction results into a single deduplicated result."""
+        if len(partials) == 1:
+            return partials[0]
+
+        merged = {
+            "facts": [fact for p in partials for fact in p.get("facts", [])],
+            "timeline_events": [event for p in partials for event in p.get("timeline_events", [])],
+            "key_figures": [figure for p in partials for figure in p.get("key_figures", [])],
+        }
+        prompt = self.REDUCE_PROMPT.format(results=json.dumps(merged, ensure_ascii=False))
+        return await self._generate_json(prompt)
+
     def get_cached_facts(
         self,
         db: Session,
@@ -276,28 +336,44 @@ Máximo 10 hechos principales, ordenados por importancia."""
         # Fall back to range-based query (combines multiple periods)
         return self.get_cached_facts_for_range(db, date_from, date_to)
 
-    async def update_facts_cache(
+    async def build_facts_cache(
         self,
         db: Session,
-        date_from: Optional[date] = None,
-        date_to: Optional[date] = None,
-        limit: Optional[int] = None
-    ) -> dict:
-        """Extract facts and save to cache."""
-        today = date.today()
-        if not date_from:
-            date_from = today - timedelta(days=1)
-        if not date_to:
-            date_to = today
+        date_from: date,
+        date_to: date,
+        limit: Optional[int] = None,
+        bypass_semantic_cache: bool = False
+    ) -> Tuple[dict, Optional[FactsCache]]:
+        """
+        Extract facts and build (but don't persist) the cache entry for a period.
+        With bypass_semantic_cache the facts are always regenerated (e.g. after a prompt change).
+        """
+        if not self.model:
+            return {"error": "Gemini not configured", "facts": []}, None
 
-        logger.info(f"Updating facts cache for {date_from} to {date_to} (limit={limit})...")
+        period_key = f"{date_from.isoformat()}_{date_to.isoformat()}"
+        articles = self.get_articles_for_range(db, date_from, date_to, limit=limit)
 
-        # Extract fresh facts
-        result = await self.extract_facts(db, date_from=date_from, date_to=date_to, limit=limit)
+        # Semantic cache: reuse this period's previous facts if its articles barely changed
+        centroid = await self._compute_centroid(articles)
+        similar = None if bypass_semantic_cache else self._find_similar_cache(db, centroid, period_key)
+
+        if similar:
+            logger.info(f"Reusing previous facts for {period_key}: article set nearly unchanged")
+            result = json.loads(similar.facts_json)
+            result.update({
+                "article_count": len(articles),
+                "date_from": date_from.isoformat(),
+                "date_to": date_to.isoformat(),
+                "generated_at": similar.generated_at.isoformat(),
+                "reused_previous": True,
+            })
+        else:
+            result = await self.extract_facts_from_articles(articles, date_from, date_to)
 
         if "error" in result:
             logger.error(f"Failed to extract facts: {result['error']}")
-            return result
+            return result, None
 
         # Prepare JSON for storage
         cache_data = {
@@ -306,21 +382,118 @@ Máximo 10 hechos principales, ordenados por importancia."""
             "key_figures": result.get("key_figures", [])
         }
 
-        period_key = f"{date_from.isoformat()}_{date_to.isoformat()}"
-
-        # Delete old cache for this period
-        db.query(FactsCache).filter(FactsCache.period_hours == period_key).delete()
+        # On reuse keep the centroid and age of the articles that produced the facts, so
+        # drift is always measured against them and is_stale still sees the real age
+        if similar:
+            embedding_centroid, generated_at = similar.embedding_centroid, similar.generated_at
+        else:
+            embedding_centroid = centroid.tobytes() if centroid is not None else None
+            generated_at = datetime.utcnow()
 
-        # Create new cache entry
         cache = FactsCache(
             period_hours=period_key,
             facts_json=json.dumps(cache_data, ensure_ascii=False),
             article_count=result.get("article_count", 0),
-            generated_at=datetime.utcnow()
+            embedding_centroid=embedding_centroid,
+            generated_at=generated_at
         )
-        db.add(cache)
+        return result, cache
+
+    async def _compute_centroid(self, articles: List[Article]) -> Optional[np.ndarray]:
+        """Embed the articles and return their normalized mean vector (float16)."""
+        if not articles:
+            return None
+
+        texts = [f"{a.title}\n{a.description or ''}" for a in articles]
+        try:
+            vectors = await self._embed_texts(texts)
+        except Exception as e:
+            logger.warning(f"Could not embed articles for semantic cache: {e}")
+            return None
+
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        centroid = vectors.mean(axis=0)
+        centroid /= np.linalg.norm(centroid) + 1e-12
+        return centroid.astype(np.float16)
+
+    async def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Embed texts in concurrent batches of EMBEDDING_BATCH_SIZE (API maximum per call)."""
+        batches = [
+            texts[i:i + self.EMBEDDING_BATCH_SIZE]
+            for i in range(0, len(texts), self.EMBEDDING_BATCH_SIZE)
+        ]
+        responses = await asyncio.gather(*(
+            genai.embed_content_async(
+                model=self.EMBEDDING_MODEL,
+                content=batch,
+                task_type="clustering"
+            )
+            for batch in batches
+        ))
+        return np.concatenate([
+            np.asarray(response["embedding"], dtype=np.float32) for response in responses
+        ])
+
+    def _find_similar_cache(
+        self,
+        db: Session,
+        centroid: Optional[np.ndarray],
+        period_key: str
+    ) -> Optional[FactsCache]:
+        """Return the period's existing cache entry if its centroid is above SEMANTIC_CACHE_THRESHOLD."""
+        if centroid is None:
+            return None
+
+        cached = db.query(FactsCache).filter(
+            FactsCache.period_hours == period_key,
+            FactsCache.embedding_centroid.isnot(None)
+        ).first()
+        if not cached or len(cached.embedding_centroid) != centroid.nbytes:
+            return None
+
+        # Centroids are stored normalized, so the dot product is the cosine similarity
+        vector = np.frombuffer(cached.embedding_centroid, dtype=np.float16).astype(np.float32)
+        if float(vector @ centroid.astype(np.float32)) >= self.SEMANTIC_CACHE_THRESHOLD:
+            return cached
+        return None
+
+    def save_facts_cache(self, db: Session, entries: List[FactsCache]):
+        """Replace cache rows for the given periods in a single transaction."""
+        if not entries:
+            return
+
+        period_keys = [entry.period_hours for entry in entries]
+        db.query(FactsCache).filter(
+            FactsCache.period_hours.in_(period_keys)
+        ).delete(synchronize_session=False)
+        db.bulk_save_objects(entries)
         db.commit()
 
+    async def update_facts_cache(
+        self,
+        db: Session,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        limit: Optional[int] = None,
+        bypass_semantic_cache: bool = False
+    ) -> dict:
+        """Extract facts and save to cache."""
+        today = date.today()
+        if not date_from:
+            date_from = today - timedelta(days=1)
+        if not date_to:
+            date_to = today
+
+        logger.info(f"Updating facts cache for {date_from} to {date_to} (limit={limit})...")
+
+        result, cache = await self.build_facts_cache(
+            db, date_from, date_to, limit=limit, bypass_semantic_cache=bypass_semantic_cache
+        )
+        if cache is None:
+            return result
+
+        self.save_facts_cache(db, [cache])
+
         logger.info(f"Facts cache updated for {date_from} to {date_to}: {len(result.get('facts', []))} facts")
         return result
 
@@ -366,6 +539,40 @@ Máximo 10 hechos principales, ordenados por importancia."""
 
         return periods
 
+    def get_nonempty_weekly_periods(
+        self,
+        db: Session,
+        start_date: date,
+        end_date: date
+    ) -> List[Tuple[date, date]]:
+        """
+        Same weekly periods as get_weekly_periods, computed in Postgres and
+        skipping weeks without articles.
+        """
+        week_starts = db.execute(
+            text("""
+                SELECT week_start::date
+                FROM generate_series(
+                    date_trunc('week', CAST(:start_date AS timestamp)),
+                    CAST(:end_date AS timestamp),
+                    interval '1 week'
+                ) AS week_start
+                WHERE EXISTS (
+                    SELECT 1 FROM articles
+                    WHERE articles.published_at >= week_start
+                      AND articles.published_at < week_start + interval '7 days'
+                )
+                ORDER BY week_start
+            """),
+            {"start_date": start_date, "end_date": end_date}
+        ).scalars().all()
+
+        # Clamp to the actual date range so period keys match get_weekly_periods
+        return [
+            (max(week_start, start_date), min(week_start + timedelta(days=6), end_date))
+            for week_start in week_starts
+        ]
+
     def get_processed_periods(self, db: Session) -> set:
         """Get all period keys that have been processed."""
         cache_entries = db.query(FactsCache.period_hours).all()
@@ -392,11 +599,11 @@ Máximo 10 hechos principales, ordenados por importancia."""
 
         logger.info(f"Processing historical facts from {min_date} to {max_date}")
 
-        # Get weekly periods
-        periods = self.get_weekly_periods(min_date, max_date)
-        logger.info(f"Found {len(periods)} weekly periods to process")
+        # Get weekly periods that actually contain articles
+        periods = self.get_nonempty_weekly_periods(db, min_date, max_date)
+        logger.info(f"Found {len(periods)} non-empty weekly periods to process")
 
-        # Get already processed periods
+        # Get already processed periods (fetched once, kept in sync as periods succeed)
         processed_periods = set() if force_reprocess else self.get_processed_periods(db)
 
         # Process each period
@@ -410,6 +617,7 @@ Máximo 10 hechos principales, ordenados por importancia."""
         }
 
         batch_count = 0
+        pending: List[Tuple[str, FactsCache, dict]] = []
         for period_start, period_end in periods:
             period_key = f"{period_start.isoformat()}_{period_end.isoformat()}"
 
@@ -425,35 +633,64 @@ Máximo 10 hechos principales, ordenados por importancia."""
 
             try:
                 logger.info(f"Processing period: {period_start} to {period_end}")
-                result = await self.update_facts_cache(
-                    db,
-                    date_from=period_start,
-                    date_to=period_end
+                result, cache = await self.build_facts_cache(
+                    db, period_start, period_end, bypass_semantic_cache=force_reprocess
                 )
-
-                if "error" not in result:
-                    results["newly_processed"] += 1
-                    results["facts_extracted"] += len(result.get("facts", []))
-                    results["details"].append({
-                        "period": period_key,
-                        "facts": len(result.get("facts", [])),
-                        "articles": result.get("article_count", 0)
-                    })
-                else:
-                    results["failed"] += 1
-                    logger.error(f"Failed to process {period_key}: {result['error']}")
-
-                batch_count += 1
-
             except Exception as e:
+                db.rollback()
                 results["failed"] += 1
                 logger.error(f"Error processing period {period_key}: {e}")
+                continue
+
+            if cache is not None:
+                pending.append((period_key, cache, result))
+            else:
+                results["failed"] += 1
+                logger.error(f"Failed to process {period_key}: {result['error']}")
+
+            batch_count += 1
+
+            if len(pending) >= self.CACHE_FLUSH_EVERY:
+                self._flush_pending_cache(db, pending, results, processed_periods)
+                pending = []
+
+        # Persist remaining periods in one round-trip
+        self._flush_pending_cache(db, pending, results, processed_periods)
 
         logger.info(f"Historical processing complete: {results['newly_processed']} new periods, "
                    f"{results['already_processed']} already cached, {results['failed']} failed")
 
         return results
 
+    def _flush_pending_cache(
+        self,
+        db: Session,
+        pending: List[Tuple[str, FactsCache, dict]],
+        results: dict,
+        processed_periods: set
+    ):
+        """Save built periods; they only count as processed once the commit succeeds."""
+        if not pending:
+            return
+
+        try:
+            self.save_facts_cache(db, [cache for _, cache, _ in pending])
+        except Exception as e:
+            db.rollback()
+            results["failed"] += len(pending)
+            logger.error(f"Error saving facts cache batch ({len(pending)} periods): {e}")
+            return
+
+        for period_key, _, result in pending:
+            processed_periods.add(period_key)
+            results["newly_processed"] += 1
+            results["facts_extracted"] += len(result.get("facts", []))
+            results["details"].append({
+                "period": period_key,
+                "facts": len(result.get("facts", [])),
+                "articles": result.get("article_count", 0)
+            })
+
     def get_cached_facts_for_range(
         self,
         db: Session,
@@ -473,6 +710,8 @@ Máximo 10 hechos principales, ordenados por importancia."""
         # Find entries that overlap with requested range
         matching_facts = []
         matching_timeline = []
+        existing_ids: set[str] = set()
+        existing_events: set[tuple] = set()
         matching_figures = {}
         total_articles = 0
         newest_generated = None
@@ -495,14 +734,17 @@ Máximo 10 hechos principales, ordenados por importancia."""
                 data = json.loads(cache.facts_json)
 
                 # Collect facts (avoid duplicates by id)
-                existing_ids = {f.get("id") for f in matching_facts}
                 for fact in data.get("facts", []):
                     if fact.get("id") and fact["id"] not in existing_ids:
                         matching_facts.append(fact)
                         existing_ids.add(fact["id"])
 
-                # Collect timeline events
-                matching_timeline.extend(data.get("timeline_events", []))
+                # Collect timeline events (avoid duplicates by date + event)
+                for event in data.get("timeline_events", []):
+                    event_key = (event.get("date"), event.get("event"))
+                    if event_key not in existing_events:
+                        matching_timeline.append(event)
+                        existing_events.add(event_key)
 
                 # Collect key figures (merge by name)
                 for figure in data.get("key_figures", []):
@@ -525,9 +767,13 @@ Máximo 10 hechos principales, ordenados por importancia."""
         if not matching_facts:
             return None
 
-        # Sort facts by importance
+        # Top 20 facts by importance (stable, same order as a full sort)
         importance_order = {"alta": 0, "media": 1, "baja": 2}
-        matching_facts.sort(key=lambda f: importance_order.get(f.get("importance", "baja"), 2))
+        top_facts = heapq.nsmallest(
+            20,
+            matching_facts,
+            key=lambda f: importance_order.get(f.get("importance", "baja"), 2)
+        )
 
         # Sort key figures by mentions
         sorted_figures = sorted(
@@ -537,7 +783,7 @@ Máximo 10 hechos principales, ordenados por importancia."""
         )[:10]  # Top 10
 
         return {
-            "facts": matching_facts[:20],  # Top 20 facts
+            "facts": top_facts,
             "timeline_events": matching_timeline[:15],
             "key_figures": sorted_figures,
             "article_count": total_articles,
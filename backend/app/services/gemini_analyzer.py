@@ -1,22 +1,49 @@
 import json
+import string
+import time
+import orjson
+import asyncio
+import hashlib
 import logging
-import google.generativeai as genai
+from collections import OrderedDict
 from typing import Optional
+from pydantic import ValidationError
+from aiolimiter import AsyncLimiter
 from app.config import get_settings
-from app.schemas import GeminiAnalysisResult
+from app.schemas import (
+    GeminiAnalysisResult,
+    AnalysisEntitySchema,
+    AnalysisResponseSchema,
+    BulkAnalysisItemSchema,
+)
+from app.services.gemini_client import GEMINI_MODEL, get_generative_model, get_genai_client
 
 logger = logging.getLogger(__name__)
 
 
+def _split_template(template: str) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """
+    Separa un template de str.format en fragmentos literales (con {{ }} ya
+    resueltos) y nombres de campos, para armar el prompt con un join.
+    """
+    literals, fields = [], []
+    current = ""
+    for literal, field, _, _ in string.Formatter().parse(template):
+        current += literal
+        if field is not None:
+            literals.append(current)
+            fields.append(field)
+            current = ""
+    literals.append(current)
+    return tuple(literals), tuple(fields)
+
+
 class GeminiAnalyzer:
     """Servicio para analizar noticias con Google Gemini AI."""
 
-    ANALYSIS_PROMPT = """Analiza el siguiente artículo de noticias en español y proporciona un análisis estructurado.
-
-ARTÍCULO:
-Título: {title}
-Fuente: {source}
-Contenido: {content}
+    # Instrucciones estáticas primero y el artículo al final: todos los prompts
+    # comparten el mismo prefijo, lo que aprovecha el cache implícito de Gemini.
+    ANALYSIS_PROMPT = """Analiza el artículo de noticias en español que aparece al final y proporciona un análisis estructurado.
 
 Responde ÚNICAMENTE con un JSON válido (sin markdown, sin ```json) con esta estructura exacta:
 {{
@@ -54,15 +81,54 @@ INSTRUCCIONES:
 
 4. **Resumen**: Resume la noticia en 2-3 oraciones en español, capturando lo esencial.
 
-Responde SOLO con el JSON, sin texto adicional."""
+Responde SOLO con el JSON, sin texto adicional.
+
+---
+ARTÍCULO:
+Título: {title}
+Fuente: {source}
+Contenido: {content}"""
+
+    BULK_ANALYSIS_PROMPT = """Analiza cada uno de los artículos de noticias en español que aparecen al final, de forma independiente.
+
+Responde ÚNICAMENTE con un array JSON con un elemento por artículo, usando el mismo "idx" de entrada:
+[
+    {{"idx": 0, "political_bias": "...", "bias_confidence": 0.0-1.0, "tone": "...", "tone_confidence": 0.0-1.0, "summary": "...", "entities": [...]}}
+]
+
+Usa para cada artículo los mismos criterios que el análisis individual:
+{criteria}
+---
+ARTÍCULOS (JSON):
+{articles}"""
+
+    _PROMPT_LITERALS, _PROMPT_FIELDS = _split_template(ANALYSIS_PROMPT)
+    # Criterios de ANALYSIS_PROMPT reutilizados tal cual en BULK_ANALYSIS_PROMPT
+    _ANALYSIS_CRITERIA = ANALYSIS_PROMPT[
+        ANALYSIS_PROMPT.index("INSTRUCCIONES:"):ANALYSIS_PROMPT.index("---\nARTÍCULO:")
+    ]
+
+    # Artículos por prompt en analyze_batch_bulk
+    BULK_SIZE = 8
+
+    # Cambiar al editar ANALYSIS_PROMPT para invalidar el cache de respuestas
+    PROMPT_VERSION = "v2"
+    CACHE_MAX_ENTRIES = 2048
+    CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+    # Estados de un batch job de Gemini que ya no van a cambiar
+    BATCH_DONE_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"}
+    BATCH_FAILED_STATES = {"JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
 
     def __init__(self):
         self.settings = get_settings()
-        if self.settings.gemini_api_key:
-            genai.configure(api_key=self.settings.gemini_api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-        else:
-            self.model = None
+        self.model = get_generative_model(response_schema=AnalysisResponseSchema)
+        self._sem = asyncio.Semaphore(self.settings.gemini_concurrency)
+        # Token bucket por RPM de Gemini; envuelve cada request, no el gather
+        self._limiter = AsyncLimiter(self.settings.gemini_rate_per_minute, 60)
+        # Cache LRU en memoria: sha256(prompt inputs) -> (expira_en, resultado)
+        self._cache: OrderedDict[str, tuple[float, GeminiAnalysisResult]] = OrderedDict()
+        if not self.model:
             logger.warning("Gemini API key not configured")
 
     async def analyze_article(
@@ -79,98 +145,249 @@ Responde SOLO con el JSON, sin texto adicional."""
         if not content:
             content = title
 
-        # Truncar contenido si es muy largo
-        max_content_length = 4000
-        if len(content) > max_content_length:
-            content = content[:max_content_length] + "..."
+        content = self._truncate_content(content)
+        cache_key = self._cache_key(title, source, content)
+        cached = self._cache_get(cache_key)
+        if cached:
+            return cached
 
-        prompt = self.ANALYSIS_PROMPT.format(
+        prompt = self._build_prompt(
             title=title,
             source=source or "Desconocida",
             content=content
         )
 
         try:
-            response = self.model.generate_content(prompt)
-            result_text = response.text.strip()
-
-            # Limpiar el texto si viene con markdown
-            if result_text.startswith("```"):
-                result_text = result_text.split("```")[1]
-                if result_text.startswith("json"):
-                    result_text = result_text[4:]
-                result_text = result_text.strip()
-
-            # Extraer JSON si hay texto extra
-            if not result_text.startswith("{"):
-                start = result_text.find("{")
-                if start != -1:
-                    result_text = result_text[start:]
-            if not result_text.endswith("}"):
-                end = result_text.rfind("}")
-                if end != -1:
-                    result_text = result_text[:end + 1]
-
-            # Parsear JSON
-            result_json = self._parse_json_safe(result_text)
-
-            if not result_json:
-                logger.warning(f"Could not parse Gemini response, using defaults")
-                return None
-
-            return GeminiAnalysisResult(
-                political_bias=result_json.get("political_bias", "center"),
-                bias_confidence=float(result_json.get("bias_confidence", 0.5)),
-                tone=result_json.get("tone", "neutral"),
-                tone_confidence=float(result_json.get("tone_confidence", 0.5)),
-                summary=result_json.get("summary", ""),
-                entities=result_json.get("entities", [])
-            )
+            async with self._limiter:
+                response = await self.model.generate_content_async(prompt)
+            # Structured output guarantees valid JSON matching AnalysisResponseSchema
+            result = self._build_result(orjson.loads(response.text))
+            self._cache_set(cache_key, result)
+            return result
 
         except Exception as e:
             logger.error(f"Error analyzing article with Gemini: {e}")
             return None
 
-    def _parse_json_safe(self, text: str) -> Optional[dict]:
-        """Intenta parsear JSON con varios métodos de limpieza."""
-        import re
+    def _build_prompt(self, **values: str) -> str:
+        """Equivalente a ANALYSIS_PROMPT.format(**values) usando los fragmentos precalculados."""
+        parts = [self._PROMPT_LITERALS[0]]
+        for field, literal in zip(self._PROMPT_FIELDS, self._PROMPT_LITERALS[1:]):
+            parts.append(values[field])
+            parts.append(literal)
+        return "".join(parts)
 
-        # Intento 1: directo
-        try:
-            return json.loads(text)
-        except json.JSONDecodeError:
-            pass
+    def _build_result(self, result_json: dict) -> GeminiAnalysisResult:
+        """
+        Construye el resultado a partir del JSON de Gemini, con valores por defecto.
+        Los campos escalares ya quedan normalizados aquí, así que se usa
+        model_construct (sin validación); solo las entidades se validan una a una.
+        """
+        return GeminiAnalysisResult.model_construct(
+            political_bias=result_json.get("political_bias", "center"),
+            bias_confidence=float(result_json.get("bias_confidence", 0.5)),
+            tone=result_json.get("tone", "neutral"),
+            tone_confidence=float(result_json.get("tone_confidence", 0.5)),
+            summary=result_json.get("summary", ""),
+            entities=self._validate_entities(result_json.get("entities") or [])
+        )
 
-        # Intento 2: limpiar caracteres problemáticos
-        try:
-            # Remover trailing commas antes de } o ]
-            cleaned = re.sub(r',\s*([}\]])', r'\1', text)
-            return json.loads(cleaned)
-        except json.JSONDecodeError:
-            pass
+    @staticmethod
+    def _validate_entities(entities: list) -> list[dict]:
+        """Valida cada entidad contra AnalysisEntitySchema y descarta las malformadas."""
+        valid = []
+        for entity in entities:
+            try:
+                valid.append(AnalysisEntitySchema.model_validate(entity).model_dump())
+            except ValidationError:
+                logger.debug(f"Entidad descartada por formato inválido: {entity}")
+        return valid
 
-        # Intento 3: escapar comillas dentro de strings
-        try:
-            # Reemplazar comillas dobles no escapadas dentro de valores
-            cleaned = re.sub(r'(?<!\\)"(?=[^:,\[\]{}]*[,}\]])', '\\"', text)
-            return json.loads(cleaned)
-        except json.JSONDecodeError:
-            pass
+    def _truncate_content(self, content: str) -> str:
+        """Recorta el contenido a gemini_max_input_chars (el sesgo y tono están al principio)."""
+        max_chars = self.settings.gemini_max_input_chars
+        if len(content) > max_chars:
+            return content[:max_chars] + "..."
+        return content
+
+    def _cache_key(self, title: str, source: Optional[str], content: str) -> str:
+        """Hash de los datos que determinan el prompt (incluye PROMPT_VERSION)."""
+        payload = orjson.dumps(
+            {"t": title, "s": source, "c": content, "v": self.PROMPT_VERSION},
+            option=orjson.OPT_SORT_KEYS
+        )
+        return hashlib.sha256(payload).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[GeminiAnalysisResult]:
+        """Retorna el análisis cacheado si existe y no ha expirado."""
+        entry = self._cache.get(key)
+        if not entry:
+            return None
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return result
+
+    def _cache_set(self, key: str, result: GeminiAnalysisResult):
+        """Guarda un análisis, descartando el menos usado si se supera el límite."""
+        self._cache[key] = (time.monotonic() + self.CACHE_TTL_SECONDS, result)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.CACHE_MAX_ENTRIES:
+            self._cache.popitem(last=False)
+
+    async def submit_batch(self, articles: list[dict]) -> Optional[str]:
+        """
+        Envía los artículos como un batch job de Gemini (Batch API: asíncrono, 50% más barato).
+        Retorna el nombre del job; los resultados llegan en el mismo orden que `articles`.
+        """
+        client = get_genai_client()
+        if not client or not articles:
+            return None
+
+        requests = []
+        for article in articles:
+            title = article.get("title", "")
+            content = self._truncate_content(article.get("content") or article.get("description") or title)
+            prompt = self._build_prompt(
+                title=title,
+                source=article.get("source_name") or "Desconocida",
+                content=content
+            )
+            requests.append({
+                "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+                "config": {
+                    "response_mime_type": "application/json",
+                    "response_schema": AnalysisResponseSchema,
+                },
+            })
+
+        job = await client.aio.batches.create(
+            model=GEMINI_MODEL,
+            src=requests,
+            config={"display_name": f"newsbot-analysis-{len(requests)}"},
+        )
+        logger.info(f"Batch de análisis enviado: {job.name} ({len(requests)} artículos)")
+        return job.name
+
+    async def get_batch_results(self, batch_name: str) -> Optional[list[Optional[GeminiAnalysisResult]]]:
+        """
+        Consulta un batch job. Retorna None si sigue en proceso, [] si falló, o un
+        resultado por request (None en los que fallaron individualmente).
+        """
+        client = get_genai_client()
+        if not client:
+            return None
 
-        logger.error(f"Failed to parse JSON after all attempts: {text[:200]}...")
-        return None
+        job = await client.aio.batches.get(name=batch_name)
+        state = job.state.value if job.state else None
+
+        if state in self.BATCH_FAILED_STATES:
+            logger.error(f"Batch {batch_name} terminó en {state}: {job.error}")
+            return []
+        if state not in self.BATCH_DONE_STATES:
+            return None
+
+        results = []
+        for inlined in (job.dest.inlined_responses if job.dest else None) or []:
+            result = None
+            if inlined.response and inlined.response.text:
+                try:
+                    result = self._build_result(orjson.loads(inlined.response.text))
+                except orjson.JSONDecodeError as e:
+                    logger.error(f"Respuesta inválida en batch {batch_name}: {e}")
+            results.append(result)
+        return results
 
     async def analyze_batch(
         self,
         articles: list[dict]
     ) -> list[tuple[dict, Optional[GeminiAnalysisResult]]]:
-        """Analiza un lote de artículos."""
-        results = []
-        for article in articles:
-            analysis = await self.analyze_article(
-                title=article.get("title", ""),
-                source=article.get("source_name"),
-                content=article.get("content") or article.get("description")
+        """Analiza un lote de artículos en paralelo (máximo gemini_concurrency a la vez)."""
+        async def analyze_one(article: dict) -> tuple[dict, Optional[GeminiAnalysisResult]]:
+            async with self._sem:
+                analysis = await self.analyze_article(
+                    title=article.get("title", ""),
+                    source=article.get("source_name"),
+                    content=article.get("content") or article.get("description")
+                )
+            return article, analysis
+
+        return list(await asyncio.gather(*(analyze_one(article) for article in articles)))
+
+    async def analyze_batch_bulk(
+        self,
+        articles: list[dict],
+        k: Optional[int] = None
+    ) -> list[tuple[dict, Optional[GeminiAnalysisResult]]]:
+        """
+        Analiza un lote enviando k artículos por prompt (menos round-trips a Gemini).
+        Los artículos que Gemini omita o devuelva malformados se re-analizan individualmente.
+        """
+        if not self.model:
+            logger.error("Gemini model not initialized")
+            return [(article, None) for article in articles]
+
+        k = k or self.BULK_SIZE
+        results: list[Optional[GeminiAnalysisResult]] = [None] * len(articles)
+        pending: list[tuple[int, str, dict]] = []
+
+        for i, article in enumerate(articles):
+            title = article.get("title", "")
+            content = self._truncate_content(article.get("content") or article.get("description") or title)
+            cache_key = self._cache_key(title, article.get("source_name"), content)
+            cached = self._cache_get(cache_key)
+            if cached:
+                results[i] = cached
+            else:
+                pending.append((i, cache_key, {
+                    "title": title,
+                    "source": article.get("source_name") or "Desconocida",
+                    "content": content,
+                }))
+
+        async def analyze_group(group: list[tuple[int, str, dict]]):
+            payload = [{"idx": n, **data} for n, (_, _, data) in enumerate(group)]
+            prompt = self.BULK_ANALYSIS_PROMPT.format(
+                criteria=self._ANALYSIS_CRITERIA,
+                articles=json.dumps(payload, ensure_ascii=False)
             )
-            results.append((article, analysis))
-        return results
+
+            parsed = {}
+            try:
+                async with self._sem, self._limiter:
+                    response = await self.model.generate_content_async(
+                        prompt,
+                        generation_config={
+                            "response_mime_type": "application/json",
+                            "response_schema": list[BulkAnalysisItemSchema],
+                        }
+                    )
+                parsed = {item.get("idx"): item for item in orjson.loads(response.text)}
+            except Exception as e:
+                logger.error(f"Error in bulk Gemini analysis, falling back to single calls: {e}")
+
+            for n, (i, cache_key, data) in enumerate(group):
+                if n in parsed:
+                    try:
+                        results[i] = self._build_result(parsed[n])
+                        self._cache_set(cache_key, results[i])
+                        continue
+                    except (TypeError, ValueError) as e:
+                        logger.warning(f"Invalid bulk Gemini result, falling back to single call: {e}")
+                async with self._sem:
+                    results[i] = await self.analyze_article(
+                        title=data["title"],
+                        source=articles[i].get("source_name"),
+                        content=articles[i].get("content") or articles[i].get("description")
+                    )
+
+        groups = [pending[j:j + k] for j in range(0, len(pending), k)]
+        await asyncio.gather(*(analyze_group(group) for group in groups))
+
+        return list(zip(articles, results))
+
+
+# Global instance
+gemini_analyzer = GeminiAnalyzer()
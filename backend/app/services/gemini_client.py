@@ -0,0 +1,54 @@
+"""
+Shared Gemini clients.
+
+google.generativeai keeps one cached (gRPC) client per service and drops
+them every time genai.configure() is called, so configuration happens
+exactly once here and every service reuses the same connections.
+"""
+import logging
+from functools import lru_cache
+from typing import Optional
+import google.generativeai as genai
+from google import genai as genai_sdk
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = "gemini-2.5-flash"
+
+
+@lru_cache
+def configure_gemini() -> bool:
+    """Configure google.generativeai once. Returns False if no API key is set."""
+    settings = get_settings()
+    if not settings.gemini_api_key:
+        return False
+    genai.configure(api_key=settings.gemini_api_key)
+    return True
+
+
+@lru_cache
+def get_generative_model(
+    model_name: str = GEMINI_MODEL,
+    response_schema: Optional[type] = None
+) -> Optional[genai.GenerativeModel]:
+    """Get a shared GenerativeModel, optionally constrained to a JSON response schema."""
+    if not configure_gemini():
+        return None
+
+    generation_config = None
+    if response_schema is not None:
+        generation_config = {
+            "response_mime_type": "application/json",
+            "response_schema": response_schema,
+        }
+    return genai.GenerativeModel(model_name, generation_config=generation_config)
+
+
+@lru_cache
+def get_genai_client() -> Optional[genai_sdk.Client]:
+    """Get the shared google.genai client (keeps its HTTP connection pool alive)."""
+    settings = get_settings()
+    if not settings.gemini_api_key:
+        return None
+    return genai_sdk.Client(api_key=settings.gemini_api_key)
@@ -1,11 +1,55 @@
+import re
 import httpx
+import orjson
+import asyncio
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from aiolimiter import AsyncLimiter
+from apify_client import ApifyClientAsync
 from typing import Optional
 from app.config import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Formatos de fecha aceptados por _parse_date (tras las rutas rápidas ISO 8601/RFC 2822)
+DATE_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%Y-%m-%dT%H:%M:%S.%fZ",
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%a, %d %b %Y %H:%M:%S %Z",
+    "%a, %d %b %Y %H:%M:%S %z",
+    "%d %b %Y",
+    "%b %d, %Y",
+    "%Y-%m-%d",
+    "%d/%m/%Y",
+    "%m/%d/%Y",
+)
+
+# Fechas relativas de Google News: "hace 3 horas", "hace un día", "2 hours ago", "ayer"
+_REL_RE = re.compile(
+    r'hace\s+(?:(?P<n_es>\d+)|una?)?\s*(?P<u_es>minuto|hora|d[ií]a)'
+    r'|(?:(?P<n_en>\d+)|an?)?\s*(?P<u_en>minute|hour|day)s?\s+ago'
+    r'|\b(?P<y>yesterday|ayer)\b',
+    re.IGNORECASE
+)
+_REL_UNITS = {
+    "minuto": "minutes", "minute": "minutes",
+    "hora": "hours", "hour": "hours",
+    "día": "days", "dia": "days", "day": "days",
+}
+
+# Campos alternativos de Apify, en orden de preferencia
+_APIFY_URL_KEYS = ("link", "url")
+_APIFY_DATE_KEYS = ("date_utc", "publishedAt", "pubDate", "date", "published")  # date_utc: ISO 2025-05-22T00:00:00.000Z
+_APIFY_IMAGE_KEYS = ("image", "thumbnail")
+
+
+def _first_value(article: dict, keys: tuple) -> Optional[str]:
+    """Retorna el primer valor no vacío entre `keys`."""
+    return next((article[k] for k in keys if article.get(k)), None)
+
 
 class NewsFetcher:
     """Servicio para obtener noticias de múltiples fuentes: Apify, GNews, NewsData.io."""
@@ -25,12 +69,35 @@ class NewsFetcher:
         "Maduro arrestado",
     ]
 
+    # Máximo de queries simultáneas contra las APIs de noticias
+    MAX_CONCURRENT_QUERIES = 4
+
     def __init__(self):
         self.settings = get_settings()
         self.newsdata_api_key = self.settings.newsdata_api_key
         self.apify_api_key = self.settings.apify_api_key
         self.gnews_api_key = self.settings.gnews_api_key
         self.last_fetch_time: Optional[datetime] = None
+        # Rate limit de NewsData.io (tier gratuito), aplicado por request real
+        self._newsdata_limiter = AsyncLimiter(self.settings.newsdata_rate_per_minute, 60)
+        # Cliente async de Apify (no bloquea el event loop durante el run del actor)
+        self._apify = ApifyClientAsync(self.apify_api_key) if self.apify_api_key else None
+        # Cliente HTTP compartido: reutiliza conexiones TCP/TLS entre requests. Las conexiones
+        # ociosas se mantienen 60s (no los 5s por defecto) para que los reintentos y fetches
+        # manuales seguidos no repitan el handshake.
+        self._http = httpx.AsyncClient(
+            timeout=30.0,
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=20,
+                max_keepalive_connections=10,
+                keepalive_expiry=60.0,
+            ),
+        )
+
+    async def aclose(self):
+        """Cierra el cliente HTTP compartido."""
+        await self._http.aclose()
 
     def set_last_fetch_time(self, last_time: Optional[datetime]):
         """Establece el tiempo del último artículo para filtrar duplicados."""
@@ -38,18 +105,26 @@ class NewsFetcher:
         if last_time:
             logger.info(f"Filtrando noticias posteriores a: {last_time}")
 
-    async def fetch_news(self, query: Optional[str] = None) -> list[dict]:
-        """Obtiene noticias: Apify (primario) -> GNews (secundario) -> NewsData.io (fallback)."""
+    async def fetch_news(self, query: Optional[str] = None, since: Optional[datetime] = None) -> list[dict]:
+        """
+        Obtiene noticias: Apify (primario) -> GNews (secundario) -> NewsData.io (fallback).
+        `since` se pasa a las APIs que permiten filtrar por fecha para no descargar artículos ya vistos.
+        Un resultado vacío pasa al siguiente proveedor; solo si todos vuelven vacíos no hay noticias nuevas.
+        """
         articles = []
         source_failed = False
 
         # 1. Intentar con Apify primero (más resultados, mejor para breaking news)
         if self.apify_api_key:
             try:
-                articles = await self._fetch_from_apify(query)
+                articles = await self._fetch_from_apify(query, since=since)
                 if articles:
                     logger.info(f"Obtenidas {len(articles)} noticias de Apify")
                     return articles
+                elif since:
+                    # Con filtro de fecha puede no haber nada nuevo, pero se confirma con GNews
+                    logger.warning(f"Apify: sin noticias nuevas para query: {query}, probando siguiente fuente")
+                    source_failed = True
                 else:
                     logger.warning(f"Apify retornó 0 resultados para query: {query}")
                     source_failed = True
@@ -61,10 +136,13 @@ class NewsFetcher:
         if self.gnews_api_key and (source_failed or not articles):
             logger.info("Intentando con GNews...")
             try:
-                articles = await self._fetch_from_gnews(query)
+                articles = await self._fetch_from_gnews(query, since=since)
                 if articles:
                     logger.info(f"Obtenidas {len(articles)} noticias de GNews")
                     return articles
+                elif since:
+                    logger.warning(f"GNews: sin noticias nuevas para query: {query}, probando siguiente fuente")
+                    source_failed = True
                 else:
                     logger.warning(f"GNews retornó 0 resultados para query: {query}")
                     source_failed = True
@@ -87,26 +165,38 @@ class NewsFetcher:
 
     async def fetch_all_queries(self) -> list[dict]:
         """Obtiene noticias para todas las queries predefinidas."""
-        all_articles = []
-        seen_urls = set()
-        skipped_old = 0
-
-        for query in self.DEFAULT_QUERIES:
-            try:
-                articles = await self.fetch_news(query)
-                for article in articles:
-                    url = article.get("url") or article.get("link")
-                    if url and url not in seen_urls:
-                        # Filtrar artículos antiguos si tenemos last_fetch_time
-                        if self.last_fetch_time and article.get("published_at"):
-                            if article["published_at"] <= self.last_fetch_time:
-                                skipped_old += 1
-                                continue
-                        seen_urls.add(url)
-                        all_articles.append(article)
-            except Exception as e:
-                logger.error(f"Error fetching query '{query}': {e}")
+        # Ejecutar las queries en paralelo, limitando la concurrencia por rate limits
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_QUERIES)
+
+        async def fetch_query(query: str) -> list[dict]:
+            async with semaphore:
+                return await self.fetch_news(query, since=self.last_fetch_time)
+
+        results = await asyncio.gather(
+            *(fetch_query(query) for query in self.DEFAULT_QUERIES),
+            return_exceptions=True
+        )
+
+        for query, result in zip(self.DEFAULT_QUERIES, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error fetching query '{query}': {result}")
+
+        # Deduplicar por URL (conserva la primera aparición, en orden de query)
+        unique = {}
+        for article in (a for r in results if not isinstance(r, Exception) for a in r):
+            url = article.get("url") or article.get("link")
+            if url:
+                unique.setdefault(url, article)
+
+        # Filtrar artículos antiguos si tenemos last_fetch_time
+        last = self.last_fetch_time
+        all_articles = [
+            a for a in unique.values()
+            if not last or not a.get("published_at") or a["published_at"] > last
+        ]
+        skipped_old = len(unique) - len(all_articles)
 
+        # Las URLs ya guardadas las descarta el INSERT ... ON CONFLICT del scheduler
         if skipped_old > 0:
             logger.info(f"Artículos omitidos por ser antiguos: {skipped_old}")
         logger.info(f"Total de artículos nuevos únicos: {len(all_articles)}")
@@ -125,41 +215,44 @@ class NewsFetcher:
         else:
             params["q"] = "Venezuela Maduro"
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(self.NEWSDATA_BASE_URL, params=params)
+        async with self._newsdata_limiter:
+            response = await self._http.get(self.NEWSDATA_BASE_URL, params=params)
 
-            # Log response for debugging
-            if response.status_code != 200:
-                logger.error(f"NewsData.io response: {response.status_code} - {response.text[:500]}")
-                response.raise_for_status()
+        # Log response for debugging
+        if response.status_code != 200:
+            logger.error(f"NewsData.io response: {response.status_code} - {response.content[:500].decode('utf-8', 'replace')}")
+            response.raise_for_status()
 
-            data = response.json()
+        data = orjson.loads(response.content)
 
-            if data.get("status") != "success":
-                raise Exception(f"NewsData API error: {data.get('message')}")
+        if data.get("status") != "success":
+            raise Exception(f"NewsData API error: {data.get('message')}")
 
-            results = data.get("results", [])
-            return self._normalize_newsdata_articles(results)
+        results = data.get("results", [])
+        return self._normalize_newsdata_articles(results)
 
     def _normalize_newsdata_articles(self, articles: list[dict]) -> list[dict]:
         """Normaliza artículos de NewsData.io al formato interno."""
-        normalized = []
-        for article in articles:
-            normalized.append({
-                "external_id": article.get("article_id"),
-                "title": article.get("title", ""),
-                "description": article.get("description"),
-                "content": article.get("content"),
-                "url": article.get("link", ""),
-                "image_url": article.get("image_url"),
-                "source_name": article.get("source_id") or article.get("source_name"),
-                "published_at": self._parse_date(article.get("pubDate")),
-                "language": article.get("language", "es"),
-                "country": ",".join(article.get("country", [])) if article.get("country") else None,
-            })
-        return normalized
+        now = datetime.utcnow()
+        return [self._normalize_one_newsdata(article, now) for article in articles]
+
+    def _normalize_one_newsdata(self, article: dict, now: datetime) -> dict:
+        """Normaliza un artículo de NewsData.io. `now` ancla las fechas relativas."""
+        country = article.get("country")
+        return {
+            "external_id": article.get("article_id"),
+            "title": article.get("title", ""),
+            "description": article.get("description"),
+            "content": article.get("content"),
+            "url": article.get("link", ""),
+            "image_url": article.get("image_url"),
+            "source_name": article.get("source_id") or article.get("source_name"),
+            "published_at": self._parse_date(article.get("pubDate"), now),
+            "language": article.get("language", "es"),
+            "country": ",".join(country) if country else None,
+        }
 
-    async def _fetch_from_gnews(self, query: Optional[str] = None) -> list[dict]:
+    async def _fetch_from_gnews(self, query: Optional[str] = None, since: Optional[datetime] = None) -> list[dict]:
         """Obtiene noticias de GNews API."""
         params = {
             "token": self.gnews_api_key,
@@ -169,23 +262,26 @@ class NewsFetcher:
             "sortby": "publishedAt",
         }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(self.GNEWS_BASE_URL, params=params)
+        if since:
+            params["from"] = since.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        response = await self._http.get(self.GNEWS_BASE_URL, params=params)
 
-            if response.status_code == 403:
-                logger.warning("GNews API: Límite de requests alcanzado (100/día)")
-                raise Exception("GNews rate limit reached")
+        if response.status_code == 403:
+            logger.warning("GNews API: Límite de requests alcanzado (100/día)")
+            raise Exception("GNews rate limit reached")
 
-            if response.status_code != 200:
-                logger.error(f"GNews response: {response.status_code} - {response.text[:500]}")
-                response.raise_for_status()
+        if response.status_code != 200:
+            logger.error(f"GNews response: {response.status_code} - {response.content[:500].decode('utf-8', 'replace')}")
+            response.raise_for_status()
 
-            data = response.json()
-            articles = data.get("articles", [])
-            return self._normalize_gnews_articles(articles)
+        data = orjson.loads(response.content)
+        articles = data.get("articles", [])
+        return self._normalize_gnews_articles(articles)
 
     def _normalize_gnews_articles(self, articles: list[dict]) -> list[dict]:
         """Normaliza artículos de GNews al formato interno."""
+        now = datetime.utcnow()
         normalized = []
         for article in articles:
             normalized.append({
@@ -196,17 +292,15 @@ class NewsFetcher:
                 "url": article.get("url", ""),
                 "image_url": article.get("image"),
                 "source_name": article.get("source", {}).get("name"),
-                "published_at": self._parse_date(article.get("publishedAt")),
+                "published_at": self._parse_date(article.get("publishedAt"), now),
                 "language": "es",
                 "country": None,
             })
         return normalized
 
-    async def _fetch_from_apify(self, query: Optional[str] = None) -> list[dict]:
+    async def _fetch_from_apify(self, query: Optional[str] = None, since: Optional[datetime] = None) -> list[dict]:
         """Obtiene noticias usando Apify Google News Scraper."""
-        from apify_client import ApifyClient
-
-        client = ApifyClient(self.apify_api_key)
+        client = self._apify
 
         run_input = {
             "query": query or "Venezuela Maduro",
@@ -214,14 +308,17 @@ class NewsFetcher:
             "maxItems": 100,
         }
 
+        if since:
+            run_input["fromDate"] = since.isoformat()
+
         try:
-            run = client.actor("easyapi/google-news-scraper").call(run_input=run_input)
+            run = await client.actor("easyapi/google-news-scraper").call(run_input=run_input)
 
             # Check if run was successful
             if not run or run.get("status") == "FAILED":
                 raise Exception(f"Apify run failed: {run.get('statusMessage', 'Unknown error')}")
 
-            items = list(client.dataset(run["defaultDatasetId"]).iterate_items())
+            items = [item async for item in client.dataset(run["defaultDatasetId"]).iterate_items()]
             logger.info(f"Apify devolvió {len(items)} items para query: {query}")
             return self._normalize_apify_articles(items)
         except Exception as e:
@@ -230,49 +327,41 @@ class NewsFetcher:
 
     def _normalize_apify_articles(self, articles: list[dict]) -> list[dict]:
         """Normaliza artículos de Apify al formato interno."""
-        normalized = []
         now = datetime.utcnow()
+        return [self._normalize_one_apify(article, now) for article in articles]
+
+    def _normalize_one_apify(self, article: dict, now: datetime) -> dict:
+        """Normaliza un artículo de Apify. `now` se usa si no trae fecha y ancla las fechas relativas."""
+        # Google News Scraper usa "link" en vez de "url"
+        url = _first_value(article, _APIFY_URL_KEYS) or ""
+
+        # Preferir date_utc (ISO format), fallback a otros campos
+        parsed_date = self._parse_date(_first_value(article, _APIFY_DATE_KEYS), now) or now
+
+        # Imagen: preferir image, luego thumbnail (puede ser base64)
+        image_url = _first_value(article, _APIFY_IMAGE_KEYS) or ""
+        # No guardar thumbnails base64 muy largos (son de baja calidad)
+        if image_url.startswith("data:") and len(image_url) > 5000:
+            image_url = ""
+
+        return {
+            "external_id": article.get("id") or url,
+            "title": article.get("title", ""),
+            "description": article.get("description") or article.get("snippet"),
+            "content": article.get("content"),
+            "url": url,
+            "image_url": image_url,
+            "source_name": article.get("source") or article.get("source_name"),
+            "published_at": parsed_date,
+            "language": "es",
+            "country": None,
+        }
 
-        for article in articles:
-            # Google News Scraper usa "link" en vez de "url"
-            url = article.get("link") or article.get("url") or ""
-
-            # Preferir date_utc (ISO format), fallback a otros campos
-            date_str = (
-                article.get("date_utc") or  # ISO format: 2025-05-22T00:00:00.000Z
-                article.get("publishedAt") or
-                article.get("pubDate") or
-                article.get("date") or
-                article.get("published")
-            )
-
-            parsed_date = self._parse_date(date_str)
-            # Si no hay fecha, usar fecha actual
-            if not parsed_date:
-                parsed_date = now
-
-            # Imagen: preferir image, luego thumbnail (puede ser base64)
-            image_url = article.get("image") or article.get("thumbnail") or ""
-            # No guardar thumbnails base64 muy largos (son de baja calidad)
-            if image_url.startswith("data:") and len(image_url) > 5000:
-                image_url = ""
-
-            normalized.append({
-                "external_id": article.get("id") or url,
-                "title": article.get("title", ""),
-                "description": article.get("description") or article.get("snippet"),
-                "content": article.get("content"),
-                "url": url,
-                "image_url": image_url,
-                "source_name": article.get("source") or article.get("source_name"),
-                "published_at": parsed_date,
-                "language": "es",
-                "country": None,
-            })
-        return normalized
-
-    def _parse_date(self, date_str: Optional[str]) -> Optional[datetime]:
-        """Parsea fechas en varios formatos."""
+    def _parse_date(self, date_str: Optional[str], now: Optional[datetime] = None) -> Optional[datetime]:
+        """
+        Parsea fechas en varios formatos. Las fechas relativas ("hace 2 horas")
+        se calculan contra `now`, normalmente fijado una vez por lote.
+        """
         if not date_str:
             return None
 
@@ -280,54 +369,35 @@ class NewsFetcher:
         if isinstance(date_str, str):
             date_str = date_str.strip()
 
-        # Manejar fechas relativas comunes de Google News
-        if isinstance(date_str, str):
-            lower = date_str.lower()
-            now = datetime.utcnow()
-
-            # Español
-            if "hace" in lower:
-                if "minuto" in lower:
-                    mins = self._extract_number(date_str) or 1
-                    return now - timedelta(minutes=mins)
-                elif "hora" in lower:
-                    hours = self._extract_number(date_str) or 1
-                    return now - timedelta(hours=hours)
-                elif "día" in lower or "dia" in lower:
-                    days = self._extract_number(date_str) or 1
-                    return now - timedelta(days=days)
-
-            # English
-            if "ago" in lower:
-                if "minute" in lower:
-                    mins = self._extract_number(date_str) or 1
-                    return now - timedelta(minutes=mins)
-                elif "hour" in lower:
-                    hours = self._extract_number(date_str) or 1
-                    return now - timedelta(hours=hours)
-                elif "day" in lower:
-                    days = self._extract_number(date_str) or 1
-                    return now - timedelta(days=days)
-
-            # "yesterday" / "ayer"
-            if "yesterday" in lower or "ayer" in lower:
-                return now - timedelta(days=1)
-
-        formats = [
-            "%Y-%m-%d %H:%M:%S",
-            "%Y-%m-%dT%H:%M:%SZ",
-            "%Y-%m-%dT%H:%M:%S.%fZ",
-            "%Y-%m-%dT%H:%M:%S%z",
-            "%a, %d %b %Y %H:%M:%S %Z",
-            "%a, %d %b %Y %H:%M:%S %z",
-            "%d %b %Y",
-            "%b %d, %Y",
-            "%Y-%m-%d",
-            "%d/%m/%Y",
-            "%m/%d/%Y",
-        ]
+            # Rutas rápidas para los formatos más comunes (sin strptime)
+            try:
+                parsed = None
+                if len(date_str) >= 19 and date_str[4] == "-" and date_str[10] == "T":
+                    # ISO 8601 (date_utc de Apify, GNews): 2025-05-22T00:00:00.000Z,
+                    # con o sin fracción de segundo u offset
+                    parsed = datetime.fromisoformat(date_str)
+                elif "," in date_str[:5]:
+                    # RFC 2822: Mon, 05 Jan 2026 10:00:00 GMT
+                    parsed = parsedate_to_datetime(date_str)
+                if parsed:
+                    if parsed.tzinfo:
+                        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+                    return parsed
+            except (ValueError, TypeError):
+                pass
 
-        for fmt in formats:
+        # Manejar fechas relativas comunes de Google News (una sola pasada de regex)
+        if isinstance(date_str, str):
+            m = _REL_RE.search(date_str)
+            if m:
+                now = now or datetime.utcnow()
+                if m["y"]:
+                    return now - timedelta(days=1)
+                unit = (m["u_es"] or m["u_en"]).lower()
+                amount = int(m["n_es"] or m["n_en"] or 1)
+                return now - timedelta(**{_REL_UNITS[unit]: amount})
+
+        for fmt in DATE_FORMATS:
             try:
                 return datetime.strptime(date_str, fmt)
             except (ValueError, TypeError):
@@ -335,9 +405,3 @@ class NewsFetcher:
 
         logger.debug(f"Could not parse date: {date_str}")
         return None
-
-    def _extract_number(self, text: str) -> Optional[int]:
-        """Extrae el primer número de un texto."""
-        import re
-        match = re.search(r'\d+', text)
-        return int(match.group()) if match else None
@@ -6,13 +6,19 @@ Generates consistent, branded Open Graph images for social sharing.
 """
 import io
 import os
+import tempfile
+import contextlib
+import base64
+import asyncio
 import logging
 import hashlib
+import numpy as np
+from functools import cached_property, lru_cache
 from pathlib import Path
 from typing import Optional
 from PIL import Image, ImageDraw, ImageFont
-from google import genai
 from app.config import get_settings
+from app.services.gemini_client import get_genai_client
 
 logger = logging.getLogger(__name__)
 
@@ -24,10 +30,29 @@ CACHE_DIR.mkdir(exist_ok=True)
 BASE_IMAGES_DIR = Path("/tmp/og_base")
 BASE_IMAGES_DIR.mkdir(exist_ok=True)
 
+# Gemini 2.5 Flash Image (Nano Banana)
+IMAGE_MODEL = "gemini-2.5-flash-image"
+
 # OG Image dimensions (standard)
 OG_WIDTH = 1200
 OG_HEIGHT = 630
 
+# zlib level for served PNGs: level 9 (optimize=True) costs several times the
+# CPU for a few percent smaller files
+PNG_COMPRESS_LEVEL = 1
+
+# Output formats for served OG images: Pillow format name and save options.
+# WebP is 30-70% smaller; PNG stays available for clients that don't accept it.
+OUTPUT_FORMATS = {
+    "png": ("PNG", {"compress_level": PNG_COMPRESS_LEVEL}),
+    "webp": ("WEBP", {"quality": 90, "method": 4}),
+}
+
+# Darkening applied under the text for readability: the same result as compositing
+# black at this alpha, done as a per-channel lookup table instead of a full RGBA blend
+TEXT_OVERLAY_ALPHA = 100
+_DARKEN_LUT = [round(v * (255 - TEXT_OVERLAY_ALPHA) / 255) for v in range(256)] * 3
+
 # Brand colors
 BRAND_COLORS = {
     "dark_bg": (15, 23, 42),       # #0f172a - slate-900
@@ -155,24 +180,180 @@ BACKGROUND_PROMPTS = {
 Style: Dark gradient background (deep navy blue to slate), subtle abstract geometric shapes, minimalist design, tech/AI aesthetic with soft glowing elements. No text, no logos. Aspect ratio: 1200x630."""
 }
 
+@lru_cache(maxsize=256)
+def _load_cached_image(path: str) -> bytes:
+    """Read a cached OG image once; repeat requests are served from memory."""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _read_cached_image(path: str) -> bytes:
+    """Serve a cached OG image, marking it as recently used for _prune_cache_dir on every hit."""
+    with contextlib.suppress(OSError):
+        os.utime(path)
+    return _load_cached_image(path)
+
+
+@lru_cache(maxsize=4096)
+def _text_length(font: ImageFont.FreeTypeFont, text: str) -> float:
+    """Advance width of a word in a (cached, long-lived) font; titles repeat many words."""
+    return font.getlength(text)
+
+
+def _write_atomic(path: Path, data: bytes):
+    """Write via a temp file + os.replace so concurrent readers never see a partial file."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
+
+
+def _save_atomic(img: Image.Image, path: Path):
+    """Save an image as PNG atomically (see _write_atomic)."""
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG")
+    _write_atomic(path, buffer.getvalue())
+
+
+def _prune_cache_dir(directory: Path, max_bytes: int) -> int:
+    """Evict least recently used files (by mtime) until the directory is under 90% of max_bytes."""
+    entries = []
+    total = 0
+    for entry in os.scandir(directory):
+        # Skip _write_atomic temp files still being written
+        if entry.is_file() and not entry.name.endswith(".tmp"):
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes * 0.9:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def _fit_og_size(img: Image.Image) -> Image.Image:
+    """Resize to the OG dimensions (LANCZOS), skipping the resize when already there."""
+    if img.size != (OG_WIDTH, OG_HEIGHT):
+        img = img.resize((OG_WIDTH, OG_HEIGHT), Image.Resampling.LANCZOS)
+    return img
+
+
+def _load_og_image(path: Path) -> Image.Image:
+    """Open a cached base image and decode it eagerly (also releases the file handle)."""
+    img = Image.open(path)
+    img.load()
+    return _fit_og_size(img)
+
+
+# Base64 signatures of PNG ("\x89PNG") and JPEG ("\xff\xd8") payloads
+_BASE64_IMAGE_PREFIXES = (b'iVBOR', b'/9j/')
+
+
+def decode_image_data(raw_data):
+    """Decode inline image data from Gemini (handles base64 in bytes or str)."""
+    if isinstance(raw_data, str):
+        return base64.b64decode(raw_data)
+    if isinstance(raw_data, bytes) and raw_data.startswith(_BASE64_IMAGE_PREFIXES):
+        return base64.b64decode(raw_data)
+    return raw_data
+
+
+def extract_response_image(response) -> Optional[Image.Image]:
+    """Return the first inline image of a Gemini response as a PIL image, or None."""
+    parts = getattr(response, 'parts', None)
+    if not parts and getattr(response, 'candidates', None):
+        parts = response.candidates[0].content.parts
+
+    for part in parts or ():
+        inline = getattr(part, 'inline_data', None)
+        if inline is None or inline.data is None:
+            if logger.isEnabledFor(logging.DEBUG) and getattr(part, 'text', None):
+                logger.debug(f"Got text part: {part.text[:100]}...")
+            continue
+        return Image.open(io.BytesIO(decode_image_data(inline.data)))
+
+    return None
+
 
 class OGImageGenerator:
     """Generates Open Graph images for social sharing."""
 
+    MAX_CONCURRENT_GENERATIONS = 2
+
+    # Cache writes between size checks of CACHE_DIR
+    CACHE_PRUNE_EVERY = 100
+
+    # Font sizes used by the layouts below, loaded at construction
+    PREWARM_FONT_SIZES = (18, 20, 28, 32, 48, 52)
+
     def __init__(self):
         self.settings = get_settings()
-        self._client = None
-        if self.settings.gemini_api_key:
-            self._client = genai.Client(api_key=self.settings.gemini_api_key)
+        self._client = get_genai_client()
+        # Caps concurrent image generations (Gemini image QPS is low)
+        self._generation_sem = asyncio.Semaphore(self.MAX_CONCURRENT_GENERATIONS)
+        # Font files are resolved once; _get_font only varies the size
+        self._font_file_regular = self._find_font_file(bold=False)
+        self._font_file_bold = self._find_font_file(bold=True)
         self._font_cache = {}
+        self._cache_max_bytes = self.settings.og_cache_max_mb * 1024 * 1024
+        self._cache_writes = 0
+        for size in self.PREWARM_FONT_SIZES:
+            self._get_font(size, bold=True)
+            self._get_font(size, bold=False)
+        # Cache paths for the fixed page/category sets, hashed once
+        self._full_ai_cache_paths = {page: self._full_ai_cache_path(page) for page in AI_PAGE_PROMPTS}
+        self._bg_cache_paths = {category: self._bg_cache_path(category) for category in BACKGROUND_PROMPTS}
+        self._ai_og_cache_paths = {page: self._ai_og_cache_path(page) for page in AI_PAGE_PROMPTS}
+        # In-flight generations by key, so concurrent misses share one Gemini call
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _full_ai_cache_path(page: str) -> Path:
+        prompt = AI_PAGE_PROMPTS.get(page, AI_PAGE_PROMPTS["default"])
+        cache_key = hashlib.md5(f"full_ai_{page}_{prompt}".encode()).hexdigest()[:12]
+        return BASE_IMAGES_DIR / f"ai_full_{cache_key}.png"
+
+    @staticmethod
+    def _bg_cache_path(category: str) -> Path:
+        prompt = BACKGROUND_PROMPTS.get(category, BACKGROUND_PROMPTS["default"])
+        cache_key = hashlib.md5(f"bg_{prompt}".encode()).hexdigest()[:12]
+        return BASE_IMAGES_DIR / f"bg_{cache_key}.png"
+
+    @staticmethod
+    def _ai_og_cache_path(page: str) -> Path:
+        cache_key = hashlib.md5(f"ai_og_{page}".encode()).hexdigest()[:16]
+        return CACHE_DIR / f"ai_og_{cache_key}.png"
 
     def _get_font(self, size: int, bold: bool = False) -> ImageFont.FreeTypeFont:
         """Get font with caching. Falls back to default if custom fonts not available."""
-        cache_key = f"{size}_{bold}"
-        if cache_key in self._font_cache:
-            return self._font_cache[cache_key]
+        cache_key = (size, bold)
+        font = self._font_cache.get(cache_key)
+        if font is not None:
+            return font
+
+        font_file = self._font_file_bold if bold else self._font_file_regular
+        font = ImageFont.truetype(font_file, size) if font_file else ImageFont.load_default()
+        self._font_cache[cache_key] = font
+        return font
 
-        # Try to load Inter font or fallback to default
+    @staticmethod
+    def _find_font_file(bold: bool) -> Optional[str]:
+        """Return the first loadable DejaVu font file, or None to use Pillow's default font."""
         font_paths = [
             "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf" if bold else "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
             "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf" if bold else "/usr/share/fonts/TTF/DejaVuSans.ttf",
@@ -181,45 +362,58 @@ class OGImageGenerator:
         for path in font_paths:
             if os.path.exists(path):
                 try:
-                    font = ImageFont.truetype(path, size)
-                    self._font_cache[cache_key] = font
-                    return font
+                    ImageFont.truetype(path, 12)
+                    return path
                 except Exception:
                     continue
+        return None
 
-        # Fallback to default
-        font = ImageFont.load_default()
-        self._font_cache[cache_key] = font
-        return font
+    @cached_property
+    def _darkened_gradient(self) -> Image.Image:
+        """The gradient background with the text darkening already applied."""
+        return self._base_gradient.point(_DARKEN_LUT)
 
     def _create_gradient_background(self) -> Image.Image:
-        """Create a gradient background programmatically (fallback if Imagen unavailable)."""
-        img = Image.new('RGB', (OG_WIDTH, OG_HEIGHT), BRAND_COLORS["dark_bg"])
-        draw = ImageDraw.Draw(img)
-
-        # Create vertical gradient
-        for y in range(OG_HEIGHT):
-            # Interpolate between dark_bg and slightly lighter
-            ratio = y / OG_HEIGHT
-            r = int(BRAND_COLORS["dark_bg"][0] + (30 - BRAND_COLORS["dark_bg"][0]) * ratio * 0.3)
-            g = int(BRAND_COLORS["dark_bg"][1] + (41 - BRAND_COLORS["dark_bg"][1]) * ratio * 0.3)
-            b = int(BRAND_COLORS["dark_bg"][2] + (59 - BRAND_COLORS["dark_bg"][2]) * ratio * 0.3)
-            draw.line([(0, y), (OG_WIDTH, y)], fill=(r, g, b))
-
-        # Add subtle accent circles
+        """Return a fresh copy of the fallback gradient background (callers draw on it)."""
+        return self._base_gradient.copy()
+
+    @cached_property
+    def _base_gradient(self) -> Image.Image:
+        """Create a gradient background programmatically (fallback if Imagen unavailable). Built once."""
+        # Vertical gradient: interpolate each row between dark_bg and slightly lighter
+        start = np.array(BRAND_COLORS["dark_bg"], dtype=np.float64)
+        end = np.array((30, 41, 59), dtype=np.float64)
+        ratios = (np.arange(OG_HEIGHT, dtype=np.float64) / OG_HEIGHT)[:, None]
+        rows = (start + (end - start) * ratios * 0.3).astype(np.uint8)  # (H, 3)
+        pixels = np.ascontiguousarray(np.broadcast_to(rows[:, None, :], (OG_HEIGHT, OG_WIDTH, 3)))
+        img = Image.fromarray(pixels, 'RGB')
+
+        # Add subtle accent circles (they don't overlap, so one overlay and one composite)
+        overlay = Image.new('RGBA', (OG_WIDTH, OG_HEIGHT), (0, 0, 0, 0))
+        overlay_draw = ImageDraw.Draw(overlay)
         for x, y, r, color, alpha in [
             (100, 100, 200, BRAND_COLORS["primary"], 30),
             (OG_WIDTH - 150, OG_HEIGHT - 100, 250, BRAND_COLORS["accent"], 25),
         ]:
-            overlay = Image.new('RGBA', (OG_WIDTH, OG_HEIGHT), (0, 0, 0, 0))
-            overlay_draw = ImageDraw.Draw(overlay)
             overlay_draw.ellipse([x-r, y-r, x+r, y+r], fill=(*color, alpha))
-            img = Image.alpha_composite(img.convert('RGBA'), overlay).convert('RGB')
+        img = Image.alpha_composite(img.convert('RGBA'), overlay).convert('RGB')
 
         return img
 
+    async def _single_flight(self, key: str, factory) -> Optional[Image.Image]:
+        """Run factory() once per key; concurrent callers await the same task."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
     async def generate_full_ai_image(self, page: str = "default") -> Optional[Image.Image]:
         """Generate a complete OG image using Gemini 2.5 Flash Image."""
+        return await self._single_flight(f"full_ai_{page}", lambda: self._generate_full_ai_image(page))
+
+    async def _generate_full_ai_image(self, page: str) -> Optional[Image.Image]:
         try:
             if not self._client:
                 logger.warning("Gemini client not configured")
@@ -228,133 +422,35 @@ class OGImageGenerator:
             prompt = AI_PAGE_PROMPTS.get(page, AI_PAGE_PROMPTS["default"])
 
             # Check cache first
-            cache_key = hashlib.md5(f"full_ai_{page}_{prompt}".encode()).hexdigest()[:12]
-            cache_path = BASE_IMAGES_DIR / f"ai_full_{cache_key}.png"
+            cache_path = self._full_ai_cache_paths.get(page) or self._full_ai_cache_path(page)
 
-            if cache_path.exists():
+            try:
+                img = _load_og_image(cache_path)
                 logger.info(f"Using cached full AI image: {cache_path}")
-                return Image.open(cache_path)
+                return img
+            except FileNotFoundError:
+                pass
 
             # Generate with Gemini 2.5 Flash Image (Nano Banana)
             logger.info(f"Generating full AI image for page: {page}")
 
-            response = self._client.models.generate_content(
-                model="gemini-2.5-flash-image",
-                contents=[prompt],
-            )
+            async with self._generation_sem:
+                response = await self._client.aio.models.generate_content(
+                    model=IMAGE_MODEL,
+                    contents=[prompt],
+                )
 
-            # Use response.parts directly (per documentation)
-            logger.info(f"Response type: {type(response)}")
-            logger.info(f"Has parts: {hasattr(response, 'parts')}")
-
-            # Extract image from response using documented approach
-            if hasattr(response, 'parts') and response.parts:
-                for part in response.parts:
-                    if part.text is not None:
-                        logger.info(f"Got text response: {part.text[:100]}...")
-                    elif part.inline_data is not None:
-                        logger.info("Found inline_data, extracting image...")
-                        try:
-                            # Use as_image() method per documentation
-                            img = part.as_image()
-                            logger.info(f"Image extracted via as_image(): {img.size}, mode: {img.mode}")
-                            img = img.resize((OG_WIDTH, OG_HEIGHT), Image.Resampling.LANCZOS)
-                            # Cache it
-                            img.save(cache_path, "PNG")
-                            logger.info(f"Cached full AI image: {cache_path}")
-                            return img
-                        except AttributeError:
-                            # Fallback: manually extract image data
-                            logger.info("as_image() not available, using manual extraction")
-                            import base64
-                            inline = part.inline_data
-                            raw_data = inline.data
-
-                            if raw_data is None:
-                                logger.warning("inline_data.data is None")
-                                continue
-
-                            # Handle base64-encoded data (can be bytes or str)
-                            if isinstance(raw_data, bytes):
-                                if raw_data[:20].startswith(b'iVBOR') or raw_data[:20].startswith(b'/9j/'):
-                                    raw_data = base64.b64decode(raw_data)
-                            elif isinstance(raw_data, str):
-                                raw_data = base64.b64decode(raw_data)
-
-                            logger.info(f"Data length: {len(raw_data)} bytes")
-
-                            image_data = io.BytesIO(raw_data)
-                            img = Image.open(image_data)
-                            logger.info(f"Image opened: {img.size}, mode: {img.mode}")
-                            img = img.resize((OG_WIDTH, OG_HEIGHT), Image.Resampling.LANCZOS)
-                            img.save(cache_path, "PNG")
-                            logger.info(f"Cached full AI image: {cache_path}")
-                            return img
-
-            # Fallback: Try legacy approach with candidates
-            elif hasattr(response, 'candidates') and response.candidates:
-                logger.info("Using candidates fallback")
-                for part in response.candidates[0].content.parts:
-                    # Check for text part first
-                    if hasattr(part, 'text') and part.text:
-                        logger.info(f"Got text part: {part.text[:200]}...")
-                        continue
-
-                    if hasattr(part, 'inline_data') and part.inline_data:
-                        import base64
-                        inline = part.inline_data
-
-                        # Debug: Log mime_type and data info
-                        mime_type = getattr(inline, 'mime_type', 'unknown')
-                        logger.info(f"Found inline_data with mime_type: {mime_type}")
-
-                        raw_data = inline.data
-
-                        if raw_data is None:
-                            logger.warning("inline_data.data is None")
-                            continue
-
-                        logger.info(f"Raw data type: {type(raw_data)}, length: {len(raw_data) if raw_data else 0}")
-
-                        # Check if data is base64-encoded (even if it's bytes type)
-                        # Base64 PNG starts with "iVBORw0KGgo" which is b'\x89PNG' decoded
-                        if isinstance(raw_data, bytes):
-                            # Check if it looks like base64 (starts with base64 chars, not binary)
-                            first_bytes = raw_data[:20]
-                            if first_bytes.startswith(b'iVBOR'):  # Base64-encoded PNG
-                                logger.info("Data is base64-encoded PNG (as bytes), decoding...")
-                                raw_data = base64.b64decode(raw_data)
-                                logger.info(f"After base64 decode - length: {len(raw_data)}")
-                            elif first_bytes.startswith(b'/9j/'):  # Base64-encoded JPEG
-                                logger.info("Data is base64-encoded JPEG (as bytes), decoding...")
-                                raw_data = base64.b64decode(raw_data)
-                                logger.info(f"After base64 decode - length: {len(raw_data)}")
-                            elif not first_bytes.startswith(b'\x89PNG') and not first_bytes.startswith(b'\xff\xd8'):
-                                # Might be base64, try to decode
-                                try:
-                                    logger.info("Data doesn't look like raw image, trying base64 decode...")
-                                    decoded = base64.b64decode(raw_data)
-                                    if decoded.startswith(b'\x89PNG') or decoded.startswith(b'\xff\xd8'):
-                                        raw_data = decoded
-                                        logger.info(f"Base64 decode successful - length: {len(raw_data)}")
-                                except Exception:
-                                    pass
-                        elif isinstance(raw_data, str):
-                            logger.info("Data is string, decoding from base64...")
-                            raw_data = base64.b64decode(raw_data)
-                            logger.info(f"After base64 decode - length: {len(raw_data)}")
-
-                        logger.info(f"Final data first 10 bytes (hex): {raw_data[:10].hex()}")
-
-                        image_data = io.BytesIO(raw_data)
-                        img = Image.open(image_data)
-                        img = img.resize((OG_WIDTH, OG_HEIGHT), Image.Resampling.LANCZOS)
-                        img.save(cache_path, "PNG")
-                        logger.info(f"Cached full AI image: {cache_path}")
-                        return img
-
-            logger.warning("Gemini returned no images in response")
-            return None
+            img = extract_response_image(response)
+            if img is None:
+                logger.warning("Gemini returned no images in response")
+                return None
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Image extracted: {img.size}, mode: {img.mode}")
+            img = _fit_og_size(img)
+            _save_atomic(img, cache_path)
+            logger.info(f"Cached full AI image: {cache_path}")
+            return img
 
         except Exception as e:
             logger.error(f"Error generating full AI image: {e}")
@@ -364,6 +460,9 @@ class OGImageGenerator:
 
     async def generate_background_with_ai(self, category: str = "default") -> Optional[Image.Image]:
         """Generate base background using Gemini 2.5 Flash Image (for text overlay mode)."""
+        return await self._single_flight(f"bg_{category}", lambda: self._generate_background_with_ai(category))
+
+    async def _generate_background_with_ai(self, category: str) -> Optional[Image.Image]:
         try:
             if not self._client:
                 logger.warning("Gemini client not configured, using fallback gradient")
@@ -371,73 +470,34 @@ class OGImageGenerator:
 
             prompt = BACKGROUND_PROMPTS.get(category, BACKGROUND_PROMPTS["default"])
 
-            # Check cache first
-            cache_key = hashlib.md5(f"bg_{prompt}".encode()).hexdigest()[:12]
-            cache_path = BASE_IMAGES_DIR / f"bg_{cache_key}.png"
+            # Check cache first (unknown categories share the default prompt's file)
+            cache_path = self._bg_cache_paths.get(category, self._bg_cache_paths["default"])
 
-            if cache_path.exists():
+            try:
+                img = _load_og_image(cache_path)
                 logger.info(f"Using cached background: {cache_path}")
-                return Image.open(cache_path)
+                return img
+            except FileNotFoundError:
+                pass
 
             # Generate with Gemini 2.5 Flash Image (Nano Banana)
             logger.info(f"Generating background for category: {category}")
 
-            response = self._client.models.generate_content(
-                model="gemini-2.5-flash-image",
-                contents=[prompt],
-            )
+            async with self._generation_sem:
+                response = await self._client.aio.models.generate_content(
+                    model=IMAGE_MODEL,
+                    contents=[prompt],
+                )
 
-            # Helper to decode image data (handles base64 in bytes or str)
-            def decode_image_data(raw_data):
-                import base64
-                if isinstance(raw_data, bytes):
-                    if raw_data[:20].startswith(b'iVBOR') or raw_data[:20].startswith(b'/9j/'):
-                        return base64.b64decode(raw_data)
-                    return raw_data
-                elif isinstance(raw_data, str):
-                    return base64.b64decode(raw_data)
-                return raw_data
-
-            # Use response.parts directly (per documentation)
-            if hasattr(response, 'parts') and response.parts:
-                for part in response.parts:
-                    if part.inline_data is not None:
-                        try:
-                            img = part.as_image()
-                            img = img.resize((OG_WIDTH, OG_HEIGHT), Image.Resampling.LANCZOS)
-                            img.save(cache_path, "PNG")
-                            logger.info(f"Cached background: {cache_path}")
-                            return img
-                        except AttributeError:
-                            inline = part.inline_data
-                            raw_data = inline.data
-                            if raw_data is None:
-                                continue
-                            raw_data = decode_image_data(raw_data)
-                            image_data = io.BytesIO(raw_data)
-                            img = Image.open(image_data)
-                            img = img.resize((OG_WIDTH, OG_HEIGHT), Image.Resampling.LANCZOS)
-                            img.save(cache_path, "PNG")
-                            logger.info(f"Cached background: {cache_path}")
-                            return img
-
-            # Fallback: candidates approach
-            if hasattr(response, 'candidates') and response.candidates:
-                for part in response.candidates[0].content.parts:
-                    if hasattr(part, 'inline_data') and part.inline_data:
-                        raw_data = part.inline_data.data
-                        if raw_data is None:
-                            continue
-                        raw_data = decode_image_data(raw_data)
-                        image_data = io.BytesIO(raw_data)
-                        img = Image.open(image_data)
-                        img = img.resize((OG_WIDTH, OG_HEIGHT), Image.Resampling.LANCZOS)
-                        img.save(cache_path, "PNG")
-                        logger.info(f"Cached background: {cache_path}")
-                        return img
-
-            logger.warning("Gemini returned no images, using fallback gradient")
-            return None
+            img = extract_response_image(response)
+            if img is None:
+                logger.warning("Gemini returned no images, using fallback gradient")
+                return None
+
+            img = _fit_og_size(img)
+            _save_atomic(img, cache_path)
+            logger.info(f"Cached background: {cache_path}")
+            return img
 
         except Exception as e:
             logger.error(f"Error generating background: {e}")
@@ -446,43 +506,70 @@ class OGImageGenerator:
             return None
 
     def _wrap_text(self, text: str, font: ImageFont.FreeTypeFont, max_width: int) -> list[str]:
-        """Wrap text to fit within max_width."""
+        """Wrap text to fit within max_width (greedy, using per-word advance widths)."""
         words = text.split()
-        lines = []
-        current_line = []
+        if not words:
+            return []
+
+        def measure(t: str) -> float:
+            if hasattr(font, "getlength"):
+                return _text_length(font, t)
+            left, _, right, _ = font.getbbox(t)
+            return right - left
+
+        space_width = measure(" ")
 
-        for word in words:
-            test_line = ' '.join(current_line + [word])
-            bbox = font.getbbox(test_line)
-            width = bbox[2] - bbox[0]
+        lines = []
+        current_line = [words[0]]
+        current_width = measure(words[0])
 
-            if width <= max_width:
+        for word in words[1:]:
+            word_width = measure(word)
+            if current_width + space_width + word_width <= max_width:
                 current_line.append(word)
+                current_width += space_width + word_width
             else:
-                if current_line:
-                    lines.append(' '.join(current_line))
+                lines.append(' '.join(current_line))
                 current_line = [word]
+                current_width = word_width
 
-        if current_line:
-            lines.append(' '.join(current_line))
-
+        lines.append(' '.join(current_line))
         return lines
 
     def _draw_text_with_shadow(
         self,
-        draw: ImageDraw.ImageDraw,
+        img: Image.Image,
         position: tuple[int, int],
-        text: str,
+        lines: list[str],
         font: ImageFont.FreeTypeFont,
         fill: tuple[int, int, int],
+        line_height: int,
         shadow_offset: int = 2
     ):
-        """Draw text with a subtle shadow for better readability."""
+        """
+        Draw lines of text with a subtle shadow for better readability.
+        The lines are rasterized once into a mask that is pasted twice (shadow, then text).
+        """
         x, y = position
-        # Shadow
-        draw.text((x + shadow_offset, y + shadow_offset), text, font=font, fill=(0, 0, 0, 128))
-        # Main text
-        draw.text((x, y), text, font=font, fill=fill)
+        mask = Image.new('L', (OG_WIDTH - x - shadow_offset, OG_HEIGHT - y - shadow_offset), 0)
+        mask_draw = ImageDraw.Draw(mask)
+        for i, line in enumerate(lines):
+            mask_draw.text((0, i * line_height), line, font=font, fill=255)
+
+        width, height = mask.size
+        sx, sy = x + shadow_offset, y + shadow_offset
+        img.paste((0, 0, 0), (sx, sy, sx + width, sy + height), mask)
+        img.paste(fill, (x, y, x + width, y + height), mask)
+
+    @staticmethod
+    def og_cache_key(
+        title: str,
+        subtitle: Optional[str] = None,
+        category: Optional[str] = None,
+        badge: Optional[str] = None
+    ) -> str:
+        """Cache key of a text OG image; also usable as its HTTP ETag."""
+        return hashlib.md5(f"{title}_{subtitle}_{category}_{badge}".encode()).hexdigest()[:16]
 
     async def generate_og_image(
         self,
@@ -490,7 +577,8 @@ class OGImageGenerator:
         subtitle: Optional[str] = None,
         category: Optional[str] = None,
         badge: Optional[str] = None,
-        use_imagen_base: bool = False
+        use_imagen_base: bool = False,
+        image_format: str = "png"
     ) -> bytes:
         """
         Generate an OG image with the given text.
@@ -501,33 +589,29 @@ class OGImageGenerator:
             category: Category for base image style (breaking, politics, tech, default)
             badge: Optional badge text (e.g., "BREAKING", "VERIFIED")
             use_imagen_base: Whether to use Gemini for base background
+            image_format: Output format, a key of OUTPUT_FORMATS ("png" or "webp")
 
         Returns:
-            PNG image bytes
+            Image bytes in the requested format
         """
         # Check cache first
-        cache_key = hashlib.md5(f"{title}_{subtitle}_{category}_{badge}".encode()).hexdigest()[:16]
-        cache_path = CACHE_DIR / f"og_{cache_key}.png"
+        cache_path = CACHE_DIR / f"og_{self.og_cache_key(title, subtitle, category, badge)}.{image_format}"
 
-        if cache_path.exists():
-            with open(cache_path, "rb") as f:
-                return f.read()
+        try:
+            return _read_cached_image(str(cache_path))
+        except FileNotFoundError:
+            pass
 
         # Get or create base image
         base_img = None
         if use_imagen_base:
             base_img = await self.generate_background_with_ai(category or "default")
 
+        # Darken the base for better text readability
         if base_img is None:
-            base_img = self._create_gradient_background()
-
-        # Convert to RGBA for compositing
-        img = base_img.convert('RGBA')
-        draw = ImageDraw.Draw(img)
-
-        # Add semi-transparent overlay for better text readability
-        overlay = Image.new('RGBA', (OG_WIDTH, OG_HEIGHT), (0, 0, 0, 100))
-        img = Image.alpha_composite(img, overlay)
+            img = self._darkened_gradient.copy()
+        else:
+            img = base_img.convert('RGB').point(_DARKEN_LUT)
         draw = ImageDraw.Draw(img)
 
         # Padding
@@ -566,9 +650,11 @@ class OGImageGenerator:
         title_font = self._get_font(52, bold=True)
         title_lines = self._wrap_text(title, title_font, content_width)
 
-        for line in title_lines[:3]:  # Max 3 lines
-            self._draw_text_with_shadow(draw, (padding, y_position), line, title_font, BRAND_COLORS["white"])
-            y_position += 62
+        title_lines = title_lines[:3]  # Max 3 lines
+        self._draw_text_with_shadow(
+            img, (padding, y_position), title_lines, title_font, BRAND_COLORS["white"], line_height=62
+        )
+        y_position += 62 * len(title_lines)
 
         y_position += 10
 
@@ -600,35 +686,28 @@ class OGImageGenerator:
                 fill=BRAND_COLORS["gray"]
             )
 
-        # Convert to RGB and save
-        final_img = img.convert('RGB')
+        return self._encode_and_cache(img, cache_path, image_format)
 
-        # Save to cache
-        final_img.save(cache_path, "PNG", optimize=True)
-
-        # Return bytes
-        buffer = io.BytesIO()
-        final_img.save(buffer, "PNG", optimize=True)
-        return buffer.getvalue()
-
-    async def generate_ai_og_image(self, page: str = "default") -> bytes:
+    async def generate_ai_og_image(self, page: str = "default", image_format: str = "png") -> bytes:
         """
         Generate a 100% AI-created OG image for a specific page.
         No text overlay - everything is generated by AI.
 
         Args:
             page: Page identifier (home, facts, sources, entities, article, default)
+            image_format: Output format, a key of OUTPUT_FORMATS ("png" or "webp")
 
         Returns:
-            PNG image bytes
+            Image bytes in the requested format
         """
         # Check cache first
-        cache_key = hashlib.md5(f"ai_og_{page}".encode()).hexdigest()[:16]
-        cache_path = CACHE_DIR / f"ai_og_{cache_key}.png"
+        cache_path = self._ai_og_cache_paths.get(page) or self._ai_og_cache_path(page)
+        cache_path = cache_path.with_suffix(f".{image_format}")
 
-        if cache_path.exists():
-            with open(cache_path, "rb") as f:
-                return f.read()
+        try:
+            return _read_cached_image(str(cache_path))
+        except FileNotFoundError:
+            pass
 
         # Generate full AI image
         img = await self.generate_full_ai_image(page)
@@ -643,23 +722,60 @@ class OGImageGenerator:
             latbot_width = latbot_bbox[2] - latbot_bbox[0]
             draw.text((60 + latbot_width, 280), ".news", font=brand_font, fill=BRAND_COLORS["primary"])
 
-        # Convert and save
-        final_img = img.convert('RGB') if img.mode != 'RGB' else img
-
-        # Save to cache
-        final_img.save(cache_path, "PNG", optimize=True)
+        return self._encode_and_cache(img, cache_path, image_format)
 
-        # Return bytes
+    def _encode_and_cache(self, img: Image.Image, cache_path: Path, image_format: str) -> bytes:
+        """Encode the final image once and write those same bytes to the cache."""
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        pil_format, save_options = OUTPUT_FORMATS[image_format]
         buffer = io.BytesIO()
-        final_img.save(buffer, "PNG", optimize=True)
-        return buffer.getvalue()
+        img.save(buffer, pil_format, **save_options)
+        data = buffer.getvalue()
+        _write_atomic(cache_path, data)
+        self._on_cache_write()
+        return data
+
+    def _on_cache_write(self):
+        """Bound the rendered image cache: every CACHE_PRUNE_EVERY writes, evict LRU files."""
+        self._cache_writes += 1
+        if self._cache_writes % self.CACHE_PRUNE_EVERY:
+            return
+        removed = _prune_cache_dir(CACHE_DIR, self._cache_max_bytes)
+        if removed:
+            logger.info(f"OG cache pruned: {removed} files removed")
+
+    async def prewarm(self):
+        """Generate the AI OG images for every known page concurrently, off the request path."""
+        if not self._client:
+            logger.info("Gemini client not configured, skipping OG prewarm")
+            return
+        pages = list(AI_PAGE_PROMPTS)
+        results = await asyncio.gather(
+            *(self.generate_ai_og_image(page) for page in pages),
+            return_exceptions=True
+        )
+        for page, result in zip(pages, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error prewarming OG image for page '{page}': {result}")
+        logger.info(f"OG images prewarmed for {len(pages)} pages")
+
+    def invalidate_ai_page(self, page: str):
+        """Drop the cached AI OG image for a page and the full-AI base images."""
+        cache_path = self._ai_og_cache_path(page)
+        for image_format in OUTPUT_FORMATS:
+            cache_path.with_suffix(f".{image_format}").unlink(missing_ok=True)
+        for f in BASE_IMAGES_DIR.glob("ai_full_*.png"):
+            f.unlink()
+        _load_cached_image.cache_clear()
 
     def clear_cache(self):
         """Clear the OG image cache."""
-        for f in CACHE_DIR.glob("og_*.png"):
+        for f in CACHE_DIR.glob("*og_*.*"):
             f.unlink()
         for f in BASE_IMAGES_DIR.glob("*.png"):
             f.unlink()
+        _load_cached_image.cache_clear()
         logger.info("OG image cache cleared")
 
 
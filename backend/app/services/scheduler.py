@@ -1,258 +1,448 @@
+import json
+import uuid
 import asyncio
 import logging
-from datetime import datetime
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.interval import IntervalTrigger
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import func, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 from app.config import get_settings
 from app.database import SessionLocal
-from app.models import Article, ArticleAnalysis, Entity
+from app.models import Article, ArticleAnalysis, Entity, AnalysisJob
+from app.schemas import GeminiAnalysisResult
 from app.services.news_fetcher import NewsFetcher
-from app.services.gemini_analyzer import GeminiAnalyzer
+from app.services.gemini_analyzer import gemini_analyzer
 from app.services.entity_unifier import entity_unifier
 from app.services.fact_extractor import fact_extractor
+from app.utils.helpers import clean_html
+from app.utils.minhash import MinHasher, LSHIndex
 
 logger = logging.getLogger(__name__)
 
+# Campos de Article que vienen del fetcher, con su valor por defecto
+_ARTICLE_FIELDS = {
+    "external_id": None,
+    "title": "",
+    "description": None,
+    "content": None,
+    "url": "",
+    "image_url": None,
+    "source_name": None,
+    "published_at": None,
+    "language": "es",
+    "country": None,
+}
+
 
 class NewsScheduler:
     """Scheduler para obtener y analizar noticias periódicamente."""
 
+    # Artículos por tanda que toma el worker de análisis de la cola
+    ANALYSIS_BATCH_SIZE = 32
+    # Índice de casi duplicados: artículos analizados de los últimos días, reconstruido a diario
+    NEAR_DUPLICATE_WINDOW_DAYS = 7
+
     def __init__(self):
         self.settings = get_settings()
-        self.scheduler = AsyncIOScheduler()
         self.news_fetcher = NewsFetcher()
-        self.gemini_analyzer = GeminiAnalyzer()
+        self.gemini_analyzer = gemini_analyzer
         self.is_running = False
-        self._fetch_in_progress = False
-        self._fetch_lock = asyncio.Lock()
+        # Un lock por job: nunca corren dos ejecuciones del mismo job a la vez
+        self._job_locks: dict[str, asyncio.Lock] = {}
+        self._last_max_published_at: Optional[datetime] = None
+        # Artículos recién guardados pendientes de análisis en línea (ver `_analysis_worker`)
+        self._analysis_queue: asyncio.Queue[dict] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._minhasher = MinHasher()
+        self._lsh: Optional[LSHIndex] = None
+        self._lsh_built_at: Optional[datetime] = None
 
     def start(self):
-        """Inicia el scheduler."""
+        """Inicia los jobs periódicos como tareas de asyncio."""
         if self.is_running:
             logger.warning("Scheduler ya está corriendo")
             return
 
         interval_minutes = self.settings.fetch_interval_minutes
-
-        self.scheduler.add_job(
-            self._fetch_and_analyze_job,
-            trigger=IntervalTrigger(minutes=interval_minutes),
-            id="news_fetch_job",
-            name=f"Fetch news every {interval_minutes} minutes",
-            replace_existing=True,
-        )
-
-        # Entity unification job - every hour
-        self.scheduler.add_job(
-            self._unify_entities_job,
-            trigger=IntervalTrigger(hours=1),
-            id="entity_unify_job",
-            name="Unify duplicate entities every hour",
-            replace_existing=True,
-        )
-
-        # Facts cache update job - every 2 hours
-        self.scheduler.add_job(
-            self._update_facts_cache_job,
-            trigger=IntervalTrigger(hours=2),
-            id="facts_cache_job",
-            name="Update facts cache every 2 hours",
-            replace_existing=True,
-        )
-
-        self.scheduler.start()
         self.is_running = True
+
+        self._tasks = [
+            asyncio.create_task(self._interval_runner(self._fetch_and_analyze_job, interval_minutes * 60)),
+            # Entity unification job - every hour
+            asyncio.create_task(self._interval_runner(self._unify_entities_job, 3600)),
+            # Facts cache update job - every 2 hours
+            asyncio.create_task(self._interval_runner(self._update_facts_cache_job, 2 * 3600)),
+            asyncio.create_task(self._analysis_worker()),
+        ]
+
+        # Gemini batch results polling
+        if self.settings.gemini_batch_analysis:
+            poll_seconds = self.settings.gemini_batch_poll_minutes * 60
+            self._tasks.append(asyncio.create_task(self._interval_runner(self._poll_batch_jobs, poll_seconds)))
+
         logger.info(f"Scheduler iniciado - fetch cada {interval_minutes} minutos, facts cache cada 2 horas")
 
     def stop(self):
         """Detiene el scheduler."""
-        if self.scheduler.running:
-            self.scheduler.shutdown()
-            self.is_running = False
-            logger.info("Scheduler detenido")
-
-    async def _fetch_and_analyze_job(self):
-        """Job principal: obtiene noticias, analiza con Gemini y guarda en DB."""
-
-        # Evitar ejecuciones concurrentes
-        if self._fetch_in_progress:
-            logger.warning("Fetch ya en progreso, omitiendo esta ejecución")
+        if not self.is_running:
             return
-
-        async with self._fetch_lock:
-            self._fetch_in_progress = True
-            logger.info("Iniciando job de fetch y análisis...")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self.is_running = False
+        logger.info("Scheduler detenido")
+
+    @property
+    def fetch_in_progress(self) -> bool:
+        lock = self._job_locks.get(self._fetch_and_analyze_job.__name__)
+        return bool(lock and lock.locked())
+
+    async def _run_exclusive(self, job, *args, **kwargs) -> bool:
+        """Ejecuta `job` salvo que ya tenga una ejecución en curso. Retorna si se ejecutó."""
+        lock = self._job_locks.setdefault(job.__name__, asyncio.Lock())
+        if lock.locked():
+            logger.warning(f"{job.__name__} ya en progreso, omitiendo esta ejecución")
+            return False
+        async with lock:
+            await job(*args, **kwargs)
+        return True
+
+    async def _interval_runner(self, job, seconds: float):
+        """
+        Ejecuta `job` cada `seconds` segundos (la primera vez tras esperar un intervalo).
+        Las ejecuciones perdidas no se acumulan y un trigger manual en curso hace saltar el turno.
+        """
+        while self.is_running:
+            await asyncio.sleep(seconds)
+            try:
+                await self._run_exclusive(job)
+            except Exception as e:
+                logger.error(f"Error en job {job.__name__}: {e}")
+
+    @staticmethod
+    def _near_duplicate_text(row: dict) -> str:
+        return f"{row['title']} {(row['content'] or row['description'] or '')[:500]}"
+
+    def _rebuild_lsh(self, db: Session):
+        """Carga en un índice LSH nuevo las firmas de los artículos analizados recientes."""
+        lsh = LSHIndex(threshold=self.settings.near_duplicate_threshold)
+        cutoff = datetime.utcnow() - timedelta(days=self.NEAR_DUPLICATE_WINDOW_DAYS)
+        query = db.query(Article.id, Article.minhash).join(
+            ArticleAnalysis, ArticleAnalysis.article_id == Article.id
+        ).filter(Article.minhash.isnot(None), Article.fetched_at >= cutoff)
+        for article_id, minhash in query.yield_per(10_000):
+            lsh.add(article_id, np.frombuffer(minhash, dtype=np.uint32))
+        self._lsh = lsh
+        self._lsh_built_at = datetime.utcnow()
+        logger.info(f"Índice de casi duplicados reconstruido con {len(lsh)} artículos")
+
+    def _index_analyzed(self, items):
+        """Agrega al índice LSH pares (article_id, minhash) de artículos ya analizados."""
+        if self._lsh is None:
+            return
+        for article_id, minhash in items:
+            if minhash:
+                self._lsh.add(article_id, np.frombuffer(minhash, dtype=np.uint32))
+
+    def _copy_analyses(self, db: Session, pairs: list[tuple]) -> int:
+        """Copia análisis y entidades de (article_id nuevo, article_id casi duplicado ya analizado)."""
+        source_ids = {source_id for _, source_id in pairs}
+        analyses = {
+            a.article_id: a for a in db.query(ArticleAnalysis).filter(ArticleAnalysis.article_id.in_(source_ids))
+        }
+        entities: dict = {}
+        for e in db.query(Entity).filter(Entity.article_id.in_(source_ids)):
+            entities.setdefault(e.article_id, []).append({
+                "type": e.entity_type,
+                "value": e.entity_value,
+                "relevance": e.relevance if e.relevance is not None else 1.0,
+            })
+
+        results = []
+        for article_id, source_id in pairs:
+            analysis = analyses.get(source_id)
+            if analysis:
+                results.append((article_id, GeminiAnalysisResult.model_construct(
+                    political_bias=analysis.political_bias,
+                    bias_confidence=analysis.bias_confidence,
+                    tone=analysis.tone,
+                    tone_confidence=analysis.tone_confidence,
+                    summary=analysis.summary_ai,
+                    entities=entities.get(source_id, []),
+                )))
+        return self._insert_analyses(db, results)
+
+    @staticmethod
+    def _insert_analyses(db: Session, results) -> int:
+        """Inserta en bloque los análisis y entidades de pares (article_id, GeminiAnalysisResult)."""
+        analyses_rows = []
+        entities_rows = []
+        analyzed_at = datetime.utcnow()
+        for article_id, analysis_result in results:
+            analyses_rows.append({
+                "article_id": article_id,
+                "political_bias": analysis_result.political_bias,
+                "bias_confidence": analysis_result.bias_confidence,
+                "tone": analysis_result.tone,
+                "tone_confidence": analysis_result.tone_confidence,
+                "summary_ai": analysis_result.summary,
+                "analyzed_at": analyzed_at,
+            })
+            for entity_data in analysis_result.entities:
+                entities_rows.append({
+                    "article_id": article_id,
+                    "entity_type": entity_data.get("type", "unknown"),
+                    "entity_value": entity_data.get("value", ""),
+                    "relevance": float(entity_data.get("relevance", 1.0)),
+                })
+
+        if analyses_rows:
+            db.execute(insert(ArticleAnalysis), analyses_rows)
+        if entities_rows:
+            db.execute(insert(Entity), entities_rows)
+        return len(analyses_rows)
+
+    async def _fetch_and_analyze_job(self, use_batch: Optional[bool] = None):
+        """
+        Job principal: obtiene noticias, analiza con Gemini y guarda en DB.
+        Con `use_batch` los análisis se envían a la Batch API y se recogen en `_poll_batch_jobs`.
+        """
+        if use_batch is None:
+            use_batch = self.settings.gemini_batch_analysis
+
+        logger.info("Iniciando job de fetch y análisis...")
 
         try:
-            # Obtener el tiempo del último artículo para evitar duplicados
-            db = SessionLocal()
-            try:
-                from sqlalchemy import func
-                last_article = db.query(func.max(Article.published_at)).scalar()
-                if last_article:
-                    self.news_fetcher.set_last_fetch_time(last_article)
-                    logger.info(f"Último artículo en DB: {last_article}")
+            with SessionLocal() as db:
+                # Tiempo del último artículo para evitar duplicados (solo se consulta tras reiniciar)
+                if self._last_max_published_at is None:
+                    with db.begin():
+                        self._last_max_published_at = db.query(func.max(Article.published_at)).scalar()
+                if self._last_max_published_at:
+                    self.news_fetcher.set_last_fetch_time(self._last_max_published_at)
+                    logger.info(f"Último artículo en DB: {self._last_max_published_at}")
                 else:
                     logger.info("No hay artículos previos, obteniendo todos")
-            finally:
-                db.close()
 
-            # Obtener noticias
-            articles = await self.news_fetcher.fetch_all_queries()
-            logger.info(f"Obtenidos {len(articles)} artículos nuevos")
+                if self._lsh is None or datetime.utcnow() - self._lsh_built_at > timedelta(days=1):
+                    with db.begin():
+                        self._rebuild_lsh(db)
+
+                # Obtener noticias (sin transacción abierta mientras se consultan las APIs)
+                articles = await self.news_fetcher.fetch_all_queries()
+                logger.info(f"Obtenidos {len(articles)} artículos nuevos")
+
+                if not articles:
+                    logger.warning("No se obtuvieron artículos")
+                    return
+
+                fetched_at = datetime.utcnow()
+
+                # Fase 1: inserción en bloque; ON CONFLICT descarta los external_id/url ya guardados.
+                # Se arma por columnas para truncar cada campo con una sola pasada.
+                cols = {
+                    field: [a.get(field, default) for a in articles]
+                    for field, default in _ARTICLE_FIELDS.items()
+                }
+                # Texto sin HTML ni entidades
+                for field in ("title", "description", "content"):
+                    cols[field] = [clean_html(v) for v in cols[field]]
+                # Truncar campos largos para evitar errores de DB
+                cols["url"] = [(v or "")[:2048] for v in cols["url"]]
+                cols["external_id"] = [(v or "")[:255] or None for v in cols["external_id"]]
+                cols["image_url"] = [(v or "")[:2048] or None for v in cols["image_url"]]
+                cols["source_name"] = [(v or "")[:255] or None for v in cols["source_name"]]
+                rows = [
+                    dict(zip(cols, values), id=uuid.uuid4(), fetched_at=fetched_at)
+                    for values in zip(*cols.values())
+                ]
+                for row in rows:
+                    row["minhash"] = self._minhasher.signature(self._near_duplicate_text(row)).tobytes()
+
+                with db.begin():
+                    inserted_ids = set(db.execute(
+                        pg_insert(Article).on_conflict_do_nothing().returning(Article.id),
+                        rows
+                    ).scalars())
+                new_articles = [row for row in rows if row["id"] in inserted_ids]
+                logger.info(f"Guardados {len(new_articles)} artículos")
+
+                self._last_max_published_at = max(
+                    filter(None, [self._last_max_published_at, *(row["published_at"] for row in new_articles)]),
+                    default=None
+                )
+
+                # Casi duplicados de artículos ya analizados: se copia su análisis en vez de llamar a Gemini
+                duplicates, to_analyze = [], []
+                for row in new_articles:
+                    match = self._lsh.query(np.frombuffer(row["minhash"], dtype=np.uint32))
+                    if match is not None:
+                        duplicates.append((row, match))
+                    else:
+                        to_analyze.append(row)
+                if duplicates:
+                    with db.begin():
+                        copied = self._copy_analyses(db, [(row["id"], match) for row, match in duplicates])
+                    self._index_analyzed((row["id"], row["minhash"]) for row, _ in duplicates)
+                    logger.info(f"{copied} casi duplicados reutilizan un análisis existente")
+
+                # Fase 2: análisis vía Batch API o en la cola del worker
+                if to_analyze and use_batch:
+                    await self._submit_analysis_batch(db, to_analyze)
+                elif to_analyze:
+                    for row in to_analyze:
+                        self._analysis_queue.put_nowait(row)
+                    logger.info(f"{len(to_analyze)} artículos en cola para análisis")
+
+        except Exception as e:
+            logger.error(f"Error en job de fetch: {e}")
+        finally:
+            logger.info("Job de fetch finalizado")
 
-            if not articles:
-                logger.warning("No se obtuvieron artículos")
-                return
+    async def _analysis_worker(self):
+        """
+        Consumidor de `_analysis_queue`: analiza tandas de hasta ANALYSIS_BATCH_SIZE artículos
+        con Gemini (BULK_SIZE artículos por prompt, concurrencia gemini_concurrency)
+        y guarda los resultados en bloque.
+        Así el fetch hace commit sin esperar a Gemini.
+        """
+        queue = self._analysis_queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.ANALYSIS_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
 
-            # Procesar en la base de datos
-            db = SessionLocal()
             try:
-                saved_count = 0
-                analyzed_count = 0
-
-                for article_data in articles:
-                    # Verificar si ya existe
-                    existing = None
-                    if article_data.get("external_id"):
-                        existing = db.query(Article).filter(
-                            Article.external_id == article_data["external_id"]
-                        ).first()
-
-                    if not existing and article_data.get("url"):
-                        existing = db.query(Article).filter(
-                            Article.url == article_data["url"]
-                        ).first()
-
-                    if existing:
-                        continue
+                results = await self.gemini_analyzer.analyze_batch_bulk(batch)
+                analyzed = [(row, analysis_result) for row, analysis_result in results if analysis_result]
+                with SessionLocal() as db, db.begin():
+                    analyzed_count = self._insert_analyses(db, [
+                        (row["id"], analysis_result) for row, analysis_result in analyzed
+                    ])
+                self._index_analyzed((row["id"], row["minhash"]) for row, _ in analyzed)
+                logger.info(f"Analizados {analyzed_count}/{len(batch)} artículos de la cola")
+            except Exception as e:
+                # Los artículos quedan sin análisis y se pueden recuperar con /analyze-pending
+                logger.error(f"Error en worker de análisis: {e}")
+            finally:
+                for _ in batch:
+                    queue.task_done()
 
-                    # Truncar campos largos para evitar errores de DB
-                    url = (article_data.get("url", "") or "")[:2048]
-                    external_id = (article_data.get("external_id") or "")[:255] or None
-                    image_url = (article_data.get("image_url") or "")[:2048] or None
-                    source_name = (article_data.get("source_name") or "")[:255] or None
-
-                    # Crear artículo
-                    article = Article(
-                        external_id=external_id,
-                        title=article_data.get("title", ""),
-                        description=article_data.get("description"),
-                        content=article_data.get("content"),
-                        url=url,
-                        image_url=image_url,
-                        source_name=source_name,
-                        published_at=article_data.get("published_at"),
-                        language=article_data.get("language", "es"),
-                        country=article_data.get("country"),
-                        fetched_at=datetime.utcnow(),
-                    )
-                    db.add(article)
-                    db.flush()
-                    saved_count += 1
-
-                    # Analizar con Gemini
-                    analysis_result = await self.gemini_analyzer.analyze_article(
-                        title=article.title,
-                        source=article.source_name,
-                        content=article.content or article.description
-                    )
-
-                    if analysis_result:
-                        # Guardar análisis
-                        analysis = ArticleAnalysis(
-                            article_id=article.id,
-                            political_bias=analysis_result.political_bias,
-                            bias_confidence=analysis_result.bias_confidence,
-                            tone=analysis_result.tone,
-                            tone_confidence=analysis_result.tone_confidence,
-                            summary_ai=analysis_result.summary,
-                            analyzed_at=datetime.utcnow(),
-                        )
-                        db.add(analysis)
-
-                        # Guardar entidades
-                        for entity_data in analysis_result.entities:
-                            entity = Entity(
-                                article_id=article.id,
-                                entity_type=entity_data.get("type", "unknown"),
-                                entity_value=entity_data.get("value", ""),
-                                relevance=float(entity_data.get("relevance", 1.0)),
-                            )
-                            db.add(entity)
+    async def _submit_analysis_batch(self, db: Session, articles: list[dict]):
+        """Envía los artículos a la Batch API y registra el job para el polling."""
+        try:
+            batch_name = await self.gemini_analyzer.submit_batch(articles)
+        except Exception as e:
+            # Los artículos quedan sin análisis y se pueden recuperar con /analyze-pending
+            logger.error(f"Error enviando batch de análisis: {e}")
+            return
 
-                        analyzed_count += 1
+        if batch_name:
+            with db.begin():
+                db.add(AnalysisJob(
+                    batch_name=batch_name,
+                    article_ids=json.dumps([str(a["id"]) for a in articles]),
+                ))
 
-                db.commit()
-                logger.info(f"Guardados {saved_count} artículos, analizados {analyzed_count}")
+    async def _poll_batch_jobs(self):
+        """Job que recoge los resultados de los batch jobs de Gemini pendientes."""
+        try:
+            with SessionLocal() as db:
+                with db.begin():
+                    jobs = db.query(AnalysisJob.id, AnalysisJob.batch_name, AnalysisJob.article_ids).filter(
+                        AnalysisJob.status == "pending"
+                    ).all()
+
+                for job_id, batch_name, article_ids_json in jobs:
+                    try:
+                        results = await self.gemini_analyzer.get_batch_results(batch_name)
+                    except Exception as e:
+                        logger.error(f"Error consultando batch {batch_name}: {e}")
+                        continue
 
-            except Exception as e:
-                db.rollback()
-                logger.error(f"Error en DB: {e}")
-                raise
-            finally:
-                db.close()
+                    if results is None:
+                        continue  # Sigue en proceso
+
+                    article_ids = [uuid.UUID(article_id) for article_id in json.loads(article_ids_json)]
+                    with db.begin():
+                        analyzed = {
+                            article_id for (article_id,) in db.query(ArticleAnalysis.article_id).filter(
+                                ArticleAnalysis.article_id.in_(article_ids)
+                            )
+                        }
+
+                        pairs = [
+                            (article_id, analysis_result)
+                            for article_id, analysis_result in zip(article_ids, results)
+                            if analysis_result and article_id not in analyzed
+                        ]
+                        analyzed_count = self._insert_analyses(db, pairs)
+                        if pairs:
+                            self._index_analyzed(db.query(Article.id, Article.minhash).filter(
+                                Article.id.in_([article_id for article_id, _ in pairs])
+                            ))
+
+                        job = db.get(AnalysisJob, job_id)
+                        job.status = "succeeded" if results else "failed"
+                        job.completed_at = datetime.utcnow()
+                    logger.info(f"Batch {batch_name}: analizados {analyzed_count}/{len(article_ids)} artículos")
 
         except Exception as e:
-            logger.error(f"Error en job de fetch: {e}")
-        finally:
-            self._fetch_in_progress = False
-            logger.info("Job de fetch finalizado")
+            logger.error(f"Error en job de polling de batches: {e}")
 
     async def run_now(self):
-        """Ejecuta el job manualmente (para trigger desde API)."""
-        await self._fetch_and_analyze_job()
+        """Ejecuta el job manualmente (para trigger desde API); analiza vía la cola, sin batch."""
+        await self._run_exclusive(self._fetch_and_analyze_job, use_batch=False)
 
     async def _unify_entities_job(self):
         """Job para unificar entidades duplicadas cada hora."""
         logger.info("Iniciando job de unificación de entidades...")
 
-        db = SessionLocal()
+        # entity_unifier hace commit por su cuenta, así que no se envuelve en db.begin()
         try:
-            # Analyze duplicates
-            analysis = await entity_unifier.analyze_duplicates(db)
+            with SessionLocal() as db:
+                # Analyze duplicates
+                analysis = await entity_unifier.analyze_duplicates(db)
 
-            if not analysis.get("groups"):
-                logger.info("No se encontraron entidades duplicadas para unificar")
-                return
+                if not analysis.get("groups"):
+                    logger.info("No se encontraron entidades duplicadas para unificar")
+                    return
 
-            # Apply unification
-            result = await entity_unifier.unify_entities(db, analysis["groups"], dry_run=False)
+                # Apply unification
+                result = await entity_unifier.unify_entities(db, analysis["groups"], dry_run=False)
 
-            logger.info(f"Entidades unificadas: {result.get('total_updates', 0)} actualizaciones")
+                logger.info(f"Entidades unificadas: {result.get('total_updates', 0)} actualizaciones")
 
         except Exception as e:
             logger.error(f"Error en job de unificación: {e}")
-        finally:
-            db.close()
 
     async def _update_facts_cache_job(self):
         """Job para actualizar cache de hechos cada 2 horas."""
         logger.info("Iniciando job de actualización de facts cache...")
 
-        db = SessionLocal()
+        # fact_extractor hace commit por su cuenta, así que no se envuelve en db.begin()
         try:
-            # Update default period (yesterday to today)
-            await fact_extractor.update_default_cache(db)
-
-            # Also process any unprocessed weeks (max 2 per run to avoid long-running jobs)
-            result = await fact_extractor.process_historical_facts(
-                db,
-                force_reprocess=False,
-                max_batches=2
-            )
-            if result.get("newly_processed", 0) > 0:
-                logger.info(f"Processed {result['newly_processed']} historical periods")
+            with SessionLocal() as db:
+                # Update default period (yesterday to today)
+                await fact_extractor.update_default_cache(db)
+
+                # Also process any unprocessed weeks (max 2 per run to avoid long-running jobs)
+                result = await fact_extractor.process_historical_facts(
+                    db,
+                    force_reprocess=False,
+                    max_batches=2
+                )
+                if result.get("newly_processed", 0) > 0:
+                    logger.info(f"Processed {result['newly_processed']} historical periods")
 
         except Exception as e:
             logger.error(f"Error en job de facts cache: {e}")
-        finally:
-            db.close()
 
     async def update_facts_now(self):
         """Trigger manual para actualizar facts cache."""
-        await self._update_facts_cache_job()
+        await self._run_exclusive(self._update_facts_cache_job)
 
 
 # Instancia global
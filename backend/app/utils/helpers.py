@@ -1,16 +1,23 @@
+import unicodedata
 from datetime import datetime
 from typing import Optional
+from selectolax.lexbor import LexborHTMLParser
 
+_MESES = (
+    "enero", "febrero", "marzo", "abril", "mayo", "junio",
+    "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre",
+)
 
-def format_relative_time(dt: Optional[datetime]) -> str:
-    """Formatea una fecha como tiempo relativo en español."""
+
+def format_relative_time(dt: Optional[datetime], now: Optional[datetime] = None) -> str:
+    """
+    Formatea una fecha (UTC naive) como tiempo relativo en español.
+    Al formatear una lista, pasar `now` una sola vez evita un utcnow() por elemento.
+    """
     if not dt:
         return "Fecha desconocida"
 
-    now = datetime.utcnow()
-    diff = now - dt
-
-    seconds = diff.total_seconds()
+    seconds = ((now or datetime.utcnow()) - dt).total_seconds()
 
     if seconds < 60:
         return "Hace un momento"
@@ -24,18 +31,26 @@ def format_relative_time(dt: Optional[datetime]) -> str:
         days = int(seconds / 86400)
         return f"Hace {days} {'día' if days == 1 else 'días'}"
     else:
-        return dt.strftime("%d de %B de %Y")
+        return f"{dt.day:02d} de {_MESES[dt.month - 1]} de {dt.year}"
 
 
 def truncate_text(text: str, max_length: int = 200) -> str:
     """Trunca texto a una longitud máxima."""
     if not text or len(text) <= max_length:
         return text
-    return text[:max_length].rsplit(" ", 1)[0] + "..."
+    i = text.rfind(" ", 0, max_length)
+    return (text[:i] if i > 0 else text[:max_length]) + "…"
 
 
-def clean_html(text: str) -> str:
-    """Limpia tags HTML básicos de un texto."""
-    import re
-    clean = re.compile('<.*?>')
-    return re.sub(clean, '', text)
+def clean_html(text: Optional[str]) -> Optional[str]:
+    """Quita tags HTML, decodifica entidades y normaliza a NFKC."""
+    if not text:
+        return text
+    # Solo se parsea si puede haber tags o entidades; el texto plano solo se normaliza
+    if "<" in text or "&" in text:
+        parser = LexborHTMLParser(text)
+        text = parser.body.text() if parser.body is not None else ""
+        # Fragmentos como "<title>x</title>" quedan en <head>: se usa el documento completo
+        if not text and parser.root is not None:
+            text = parser.root.text()
+    return unicodedata.normalize("NFKC", text)
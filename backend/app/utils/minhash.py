@@ -0,0 +1,80 @@
+import hashlib
+from typing import Hashable, Optional
+
+import numpy as np
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def _hash32(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=4).digest(), "little")
+
+
+class MinHasher:
+    """
+    Firmas MinHash (uint32) sobre shingles de caracteres.
+    Los coeficientes se derivan de blake2b, así las firmas persistidas siguen
+    siendo comparables entre reinicios y versiones de numpy.
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        # Coeficientes < 2^32: a * x + b cabe en uint64 sin desbordar
+        self._a = np.array([_hash32(b"a%d" % i) | 1 for i in range(num_perm)], dtype=np.uint64)
+        self._b = np.array([_hash32(b"b%d" % i) for i in range(num_perm)], dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        text = " ".join(text.lower().split())
+        k = self.shingle_size
+        shingles = {text[i:i + k] for i in range(max(1, len(text) - k + 1))}
+        hashes = np.fromiter(
+            (_hash32(s.encode("utf-8")) for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return (permuted & _MAX_HASH).min(axis=0).astype(np.uint32)
+
+
+class LSHIndex:
+    """
+    Índice LSH por bandas sobre firmas MinHash. `query` confirma los candidatos
+    con la similitud de Jaccard estimada, así que no hay falsos positivos bajo `threshold`.
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 8, threshold: float = 0.85):
+        if num_perm % bands:
+            raise ValueError("num_perm debe ser múltiplo de bands")
+        self.threshold = threshold
+        self._rows = num_perm // bands
+        self._buckets: list[dict[bytes, list[Hashable]]] = [{} for _ in range(bands)]
+        self._signatures: dict[Hashable, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _band_keys(self, signature: np.ndarray):
+        r = self._rows
+        return (signature[i * r:(i + 1) * r].tobytes() for i in range(len(self._buckets)))
+
+    def add(self, key: Hashable, signature: np.ndarray):
+        if key in self._signatures:
+            return
+        self._signatures[key] = signature
+        for buckets, band in zip(self._buckets, self._band_keys(signature)):
+            buckets.setdefault(band, []).append(key)
+
+    def query(self, signature: np.ndarray) -> Optional[Hashable]:
+        """Retorna la clave más similar con Jaccard estimado >= threshold, o None."""
+        candidates = set()
+        for buckets, band in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(buckets.get(band, ()))
+
+        best_key, best_score = None, self.threshold
+        for key in candidates:
+            score = float(np.mean(self._signatures[key] == signature))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key